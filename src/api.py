@@ -7,14 +7,42 @@ from flask import Flask, request, jsonify
 from src.graph.workflow import build_app
 from src.graph.state import ReportState
 from src.pdf_parser import build_report_json_from_pdf
+from src.config import WARMUP_ON_STARTUP, MIGRATE_ON_STARTUP
+from src.migrations import run_migrations_once
+from src.warmup import start_background_warmup, mark_ready, warmup_status
 import tempfile
 import os
 
 app = Flask(__name__)
 
+# Schema DDL runs once here (or at deploy time), never per request
+if MIGRATE_ON_STARTUP:
+    run_migrations_once()
+
 # Build LangGraph app once at startup
 langgraph_app = build_app()
 
+# Warm model + retrieval/Tavily/specialist caches in the background; /health is 503 until done
+if WARMUP_ON_STARTUP:
+    start_background_warmup()
+else:
+    mark_ready()
+
+# web_budget_ms is clamped to this range (ms); 0 effectively means "local only"
+WEB_BUDGET_MAX_MS = 30000
+
+
+def parse_web_budget_ms(value: Any) -> Optional[int]:
+    """None if absent; otherwise an int clamped to [0, WEB_BUDGET_MAX_MS]. ValueError on junk."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError("web_budget_ms must be an integer number of milliseconds")
+    try:
+        budget = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("web_budget_ms must be an integer number of milliseconds")
+    return max(0, min(budget, WEB_BUDGET_MAX_MS))
 
 
 def run_workflow(
@@ -24,6 +52,7 @@ def run_workflow(
     medications: List[str] = [],
     medical_history: str = "",
     disable_critic: bool = False, # New Arg
+    web_budget_ms: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
     Helper to invoke the LangGraph workflow and return the full final_state dict.
@@ -35,6 +64,7 @@ def run_workflow(
         "logs": [],
         "citations": [],   # ✅ ensure exists at start
         "knowledge_source": knowledge_source,
+        "web_budget_ms": web_budget_ms,
         "medications": medications,
         "medical_history": medical_history,
         "medication_analysis": "",
@@ -52,9 +82,18 @@ def run_workflow(
 
 @app.route("/health", methods=["GET"])
 def health():
+    warmup = warmup_status()
+    if warmup["state"] == "warming":
+        return jsonify({
+            "status": "warming",
+            "message": "Warming caches, not ready for traffic yet",
+            "warmup": warmup,
+        }), 503
+    # A failed warm-up only means cold caches, the API itself still works
     return jsonify({
         "status": "ok",
-        "message": "Patient Report Intelligence API is running"
+        "message": "Patient Report Intelligence API is running",
+        "warmup": warmup,
     }), 200
 
 
@@ -82,6 +121,11 @@ def analyze_json():
         previous_report = body.get("previous_report")
         knowledge_source = body.get("knowledge_source", "local")
         disable_critic = body.get("disable_critic", False) # New ablation param
+        try:
+            # only used by knowledge_source="hybrid-budgeted"
+            web_budget_ms = parse_web_budget_ms(body.get("web_budget_ms"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         medications = body.get("medications", [])
         medical_history = body.get("medical_history", "")
@@ -92,7 +136,8 @@ def analyze_json():
             knowledge_source=knowledge_source,
             medications=medications,
             medical_history=medical_history,
-            disable_critic=disable_critic # Pass to workflow
+            disable_critic=disable_critic, # Pass to workflow
+            web_budget_ms=web_budget_ms,
         )
         final_report = final_state.get("final_report", "")
         logs = final_state.get("logs", [])
@@ -164,6 +209,10 @@ def analyze_pdf():
         current_date = form.get("current_date", "2025-12-10")
         previous_date = form.get("previous_date")  # may be None
         knowledge_source = form.get("knowledge_source", "local")  # Default to local
+        try:
+            web_budget_ms = parse_web_budget_ms(form.get("web_budget_ms"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # New fields
         medical_history = form.get("medical_history", "")
@@ -211,7 +260,8 @@ def analyze_pdf():
             previous_report, 
             knowledge_source=knowledge_source,
             medications=medications,
-            medical_history=medical_history
+            medical_history=medical_history,
+            web_budget_ms=web_budget_ms,
         )
         final_report = final_state.get("final_report", "")
         logs = final_state.get("logs", [])
@@ -276,11 +326,7 @@ def chat_endpoint():
 # -------------------------------------------------------------------
 #  Patient Profile Endpoints (MySQL)
 # -------------------------------------------------------------------
-from src.patient_profile_store import get_profile, save_profile, create_profile_table_if_not_exists
-
-# Initialize table on startup
-with app.app_context():
-    create_profile_table_if_not_exists()
+from src.patient_profile_store import get_profile, save_profile
 
 @app.route("/patient-profile", methods=["GET"])
 def get_patient_profile():
@@ -3,9 +3,12 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 import json
+import zlib
 from datetime import datetime, date
 
+from src.config import AUDIT_COMPRESS_PAYLOADS
 from src.db import get_connection  # <-- use your existing db connector
+from src.storage import get_storage
 
 
 def _to_date(val: str) -> date:
@@ -13,18 +16,32 @@ def _to_date(val: str) -> date:
     return datetime.strptime(val, "%Y-%m-%d").date()
 
 
-def insert_audit_log(
+AUDIT_LOG_INSERT_SQL = """
+    INSERT INTO audit_logs
+      (patient_id, report_date, abnormal_tests_count,
+       trends_json, escalation_json, knowledge_sources_json, payload_zlib, created_at)
+    VALUES
+      (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def audit_log_row(
     patient_id: str,
     report_date: str,
     abnormal_tests_count: int,
     trends: Optional[Dict[str, Any]],
     enriched_tests: List[Dict[str, Any]],
-) -> None:
+    created_at: Optional[datetime] = None,
+) -> tuple:
     """
-    Insert one audit row for a single LangGraph run.
+    Parameters for AUDIT_LOG_INSERT_SQL:
     - trends_json: state['trends']
     - escalation_json: per abnormal test severity
     - knowledge_sources_json: per abnormal test sources/ref_ids
+    - payload_zlib: with AUDIT_COMPRESS_PAYLOADS, trends + knowledge sources
+      (the large ones) compressed together instead of the two JSON columns
+    - created_at: when the run was logged (default now); the buffered writer passes
+      the enqueue time so late or replayed rows land in the right month
     """
 
     trends_json = json.dumps(trends or {}, ensure_ascii=False)
@@ -51,26 +68,60 @@ def insert_audit_log(
     escalation_json = json.dumps(escalation_payload, ensure_ascii=False)
     knowledge_sources_json = json.dumps(sources_payload, ensure_ascii=False)
 
+    payload_zlib = None
+    if AUDIT_COMPRESS_PAYLOADS:
+        payload_zlib = zlib.compress(
+            json.dumps({"trends": trends or {}, "knowledge_sources": sources_payload}, ensure_ascii=False).encode("utf-8")
+        )
+        trends_json = knowledge_sources_json = None
+
+    return (
+        patient_id,
+        _to_date(report_date),
+        int(abnormal_tests_count),
+        trends_json,
+        escalation_json,
+        knowledge_sources_json,
+        payload_zlib,
+        created_at or get_storage().now(),
+    )
+
+
+def _json_col(val: Any) -> Any:
+    return json.loads(val) if isinstance(val, (str, bytes, bytearray)) else val
+
+
+def decode_audit_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    An audit_logs row (dictionary cursor) with trends / escalations / knowledge_sources
+    parsed, whether they were stored as JSON columns or in payload_zlib.
+    """
+    out = {k: v for k, v in row.items() if k not in ("trends_json", "escalation_json", "knowledge_sources_json", "payload_zlib")}
+    out["trends"] = _json_col(row.get("trends_json"))
+    out["escalations"] = _json_col(row.get("escalation_json"))
+    out["knowledge_sources"] = _json_col(row.get("knowledge_sources_json"))
+    if row.get("payload_zlib"):
+        payload = json.loads(zlib.decompress(row["payload_zlib"]).decode("utf-8"))
+        out["trends"] = payload.get("trends")
+        out["knowledge_sources"] = payload.get("knowledge_sources")
+    return out
+
+
+def insert_audit_log(
+    patient_id: str,
+    report_date: str,
+    abnormal_tests_count: int,
+    trends: Optional[Dict[str, Any]],
+    enriched_tests: List[Dict[str, Any]],
+) -> None:
+    """
+    Insert one audit row for a single LangGraph run.
+    """
+    row = audit_log_row(patient_id, report_date, abnormal_tests_count, trends, enriched_tests)
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO audit_logs
-                  (patient_id, report_date, abnormal_tests_count,
-                   trends_json, escalation_json, knowledge_sources_json)
-                VALUES
-                  (%s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    patient_id,
-                    _to_date(report_date),
-                    int(abnormal_tests_count),
-                    trends_json,
-                    escalation_json,
-                    knowledge_sources_json,
-                )
-            )
+            cur.execute(AUDIT_LOG_INSERT_SQL, row)
         conn.commit()
     finally:
         conn.close()
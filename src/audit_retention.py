@@ -0,0 +1,204 @@
+# src/audit_retention.py
+
+from __future__ import annotations
+import gzip
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.config import AUDIT_ARCHIVE_DIR, AUDIT_PARTITION_MONTHS_AHEAD, AUDIT_RETENTION_MONTHS
+from src.db import get_connection
+from src.storage import get_storage
+from src.audit_logger import decode_audit_row
+
+# MySQL: audit_logs is RANGE-partitioned by month on created_at (migration 8):
+# partition pYYYYMM holds rows created before the first day of the following month,
+# pmax catches anything beyond the partitions created so far. Expiring a month is
+# then an export + DROP PARTITION instead of a large DELETE.
+# SQLite (or a MySQL table that isn't partitioned): same export, then one DELETE per month.
+
+# Rows fetched per round trip while exporting a month (never the whole month in memory)
+ARCHIVE_FETCH_SIZE = 1000
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    idx = d.year * 12 + d.month - 1 + months
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_def(month: date) -> str:
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d} 00:00:00'))"
+
+
+def audit_partitions(cur) -> List[str]:
+    """Partition names of audit_logs, oldest first ([] if the table isn't partitioned / not MySQL)."""
+    if get_storage().name != "mysql":
+        return []
+    cur.execute(
+        """
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'audit_logs' AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+        """
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def partition_audit_logs(cur, months_ahead: int = AUDIT_PARTITION_MONTHS_AHEAD) -> None:
+    """
+    Migration step: monthly RANGE partitions from the oldest row to `months_ahead` months out.
+    MySQL requires the partition column in every unique key, so the primary key becomes (id, created_at).
+    """
+    if audit_partitions(cur):
+        return
+    cur.execute("SELECT MIN(created_at) FROM audit_logs")
+    oldest = cur.fetchone()[0]
+    first = month_start(oldest.date() if oldest else date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    months = [add_months(first, i) for i in range((last.year - first.year) * 12 + last.month - first.month + 1)]
+
+    cur.execute(
+        """
+        ALTER TABLE audit_logs
+          MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          DROP PRIMARY KEY,
+          ADD PRIMARY KEY (id, created_at)
+        """
+    )
+    defs = [_partition_def(m) for m in months] + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]
+    cur.execute(f"ALTER TABLE audit_logs PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ({', '.join(defs)})")
+
+
+def ensure_future_partitions(months_ahead: int = AUDIT_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Splits the missing upcoming months out of pmax (cheap while pmax is empty). Returns the new partitions."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            existing = audit_partitions(cur)
+            if not existing:
+                return []
+            month = add_months(month_start(date.today()), -1)
+            wanted = [add_months(month, i) for i in range(months_ahead + 2)]
+            newest = max((p for p in existing if p != "pmax"), default="p000000")
+            missing = [m for m in wanted if partition_name(m) > newest]
+            if missing:
+                defs = [_partition_def(m) for m in missing] + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]
+                cur.execute(f"ALTER TABLE audit_logs REORGANIZE PARTITION pmax INTO ({', '.join(defs)})")
+            return [partition_name(m) for m in missing]
+    finally:
+        conn.close()
+
+
+def _json_default(val: Any) -> Any:
+    if isinstance(val, (date, datetime)):
+        return val.isoformat()
+    return str(val)
+
+
+def _month_rows(conn, month: date, fetch_size: int = ARCHIVE_FETCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Streams one month of audit_logs in id order, `fetch_size` rows at a time."""
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(
+            "SELECT * FROM audit_logs WHERE created_at >= %s AND created_at < %s ORDER BY id",
+            (month, add_months(month, 1)),
+        )
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                return
+            yield from rows
+
+
+def _write_archive(rows: Iterator[Dict[str, Any]], month: date, archive_dir: str) -> Tuple[str, int]:
+    """
+    gzipped JSONL, one decoded audit row per line, written as the rows stream in;
+    to a temp file, fsynced before the rename. Returns (path, rows written).
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"audit_logs_{month:%Y%m}.jsonl.gz")
+    tmp_path = path + ".tmp"
+    n_rows = 0
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row in rows:
+                gz.write((json.dumps(decode_audit_row(row), ensure_ascii=False, default=_json_default) + "\n").encode("utf-8"))
+                n_rows += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)  # a re-run after a crash rewrites the same, still complete, month
+    return path, n_rows
+
+
+def _expired_months(cur, cutoff: date) -> List[date]:
+    cur.execute("SELECT MIN(created_at) FROM audit_logs WHERE created_at < %s", (cutoff,))
+    oldest = cur.fetchone()[0]
+    if oldest is None:
+        return []
+    if isinstance(oldest, str):  # SQLite aggregate results have no declared type
+        oldest = datetime.fromisoformat(oldest)
+    month, months = month_start(oldest.date()), []
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archive_audit_logs(
+    retention_months: int = AUDIT_RETENTION_MONTHS,
+    archive_dir: str = AUDIT_ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> List[Tuple[str, int, Optional[str]]]:
+    """
+    Exports every whole month older than `retention_months` to
+    <archive_dir>/audit_logs_YYYYMM.jsonl.gz and removes it from audit_logs
+    (DROP PARTITION on MySQL, DELETE otherwise). Returns [(month, rows, path)].
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    done = []
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            partitions = set(audit_partitions(cur))
+            months = _expired_months(cur, cutoff)
+        for month in months:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COUNT(*) FROM audit_logs WHERE created_at >= %s AND created_at < %s",
+                    (month, add_months(month, 1)),
+                )
+                n_rows = int(cur.fetchone()[0])
+            name = partition_name(month)
+            if not n_rows and name not in partitions:
+                continue
+            if dry_run:
+                done.append((f"{month:%Y-%m}", n_rows, None))
+                continue
+            path = None
+            if n_rows:
+                path, n_rows = _write_archive(_month_rows(conn, month), month, archive_dir)
+
+            with conn.cursor() as cur:
+                if name in partitions:
+                    cur.execute(f"ALTER TABLE audit_logs DROP PARTITION {name}")
+                else:
+                    # no partition for this month (SQLite / unpartitioned table): delete the range
+                    cur.execute(
+                        "DELETE FROM audit_logs WHERE created_at >= %s AND created_at < %s",
+                        (month, add_months(month, 1)),
+                    )
+            conn.commit()
+            done.append((f"{month:%Y-%m}", n_rows, path))
+    finally:
+        conn.close()
+    return done
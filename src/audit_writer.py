@@ -0,0 +1,300 @@
+# src/audit_writer.py
+
+from __future__ import annotations
+import atexit
+import base64
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev setups only
+    fcntl = None
+
+from src.config import (
+    AUDIT_QUEUE_SIZE,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL_MS,
+    AUDIT_SPILL_PATH,
+)
+from src.audit_logger import AUDIT_LOG_INSERT_SQL, audit_log_row
+from src.db import get_connection
+from src.storage import get_storage
+
+# Seconds between attempts to replay the spill file while it has rows in it
+SPILL_RETRY_SECONDS = 30
+
+
+def _owner_alive(replay_path: str) -> bool:
+    """True if the (other) process named in <spill>.<pid>.replay is still running."""
+    try:
+        pid = int(replay_path.rsplit(".", 2)[-2])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False  # our own leftover from a previous process with the same PID
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    """
+    Write-behind audit log: submit() only enqueues (no JSON, no DB on the request path).
+    A daemon thread serialises rows and writes them as one executemany per batch
+    (a multi-row INSERT). Rows that can't be written - DB down, queue full - are appended
+    to a JSONL spill file, replayed into audit_logs once the DB accepts writes again.
+    The spill file is shared by all workers of a deployment; appends and the move-aside
+    for replay happen under an flock on <spill>.lock, so no worker can append to a file
+    another one has already taken for replay.
+    Every row carries its enqueue time as created_at, so late or replayed rows keep
+    their real timestamp (month partitions / retention go by it).
+    close() (registered with atexit) drains the queue before the process exits.
+    """
+
+    def __init__(self, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval_ms: int = AUDIT_FLUSH_INTERVAL_MS, spill_path: str = AUDIT_SPILL_PATH):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.spill_path = spill_path
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._next_replay = 0.0
+        self.stats = {"written": 0, "batches": 0, "spilled": 0, "replayed": 0, "quarantined": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True, name="audit-writer")
+        self._thread.start()
+
+    # ---- producer side ----
+
+    def submit(self, patient_id: str, report_date: str, abnormal_tests_count: int,
+               trends: Optional[Dict[str, Any]], enriched_tests: List[Dict[str, Any]]) -> None:
+        item = (patient_id, report_date, abnormal_tests_count, trends, enriched_tests, get_storage().now())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # never block a request on audit I/O; the spill file is replayed later
+            self._spill([audit_log_row(*item)])
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ---- flusher ----
+
+    def _next_batch(self, timeout: float) -> List[tuple]:
+        items = []
+        try:
+            items.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return items
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _insert(self, rows: List[tuple]) -> None:
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(AUDIT_LOG_INSERT_SQL, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _write(self, items: List[tuple]) -> None:
+        rows = []
+        for item in items:
+            try:
+                rows.append(audit_log_row(*item))
+            except Exception as e:  # a malformed row shouldn't take the batch down
+                print(f"audit writer: dropping unserialisable row for {item[0]}: {e}")
+        if not rows:
+            return
+        try:
+            self._insert(rows)
+        except Exception as e:
+            print(f"audit writer: DB write failed ({e}); spilling {len(rows)} rows to {self.spill_path}")
+            self._spill(rows)
+            return
+        self.stats["written"] += len(rows)
+        self.stats["batches"] += 1
+        if time.monotonic() >= self._next_replay:
+            self._replay_spill()
+
+    def _run(self) -> None:
+        # Replay files left behind by a process that died mid-replay
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*.replay"):
+            if not _owner_alive(path):
+                self._guarded(self._replay_orphan, path)
+        while not self._stop.is_set():
+            items = self._next_batch(self.flush_interval)
+            if items:
+                self._guarded(self._write, items)
+            elif time.monotonic() >= self._next_replay:
+                self._guarded(self._replay_spill)
+
+    def _guarded(self, fn, *args) -> None:
+        """One flusher step; an unexpected error is logged and the thread keeps going."""
+        try:
+            fn(*args)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"audit writer: {getattr(fn, '__name__', fn)} failed: {e!r}")
+
+    # ---- spill file ----
+
+    @contextmanager
+    def _spill_locked(self) -> Iterator[None]:
+        """Thread lock + exclusive flock on <spill>.lock (shared by every process using the spill file)."""
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.spill_path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _spill_value(v: Any) -> Any:
+        if isinstance(v, date):
+            return v.isoformat()
+        if isinstance(v, (bytes, bytearray)):
+            return {"b64": base64.b64encode(v).decode("ascii")}  # payload_zlib
+        return v
+
+    def _spill(self, rows: List[tuple]) -> None:
+        lines = "".join(
+            json.dumps([self._spill_value(v) for v in row], ensure_ascii=False) + "\n"
+            for row in rows
+        )
+        with self._spill_locked():
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        self.stats["spilled"] += len(rows)
+
+    @staticmethod
+    def _parse_spill_line(line: str, fallback_created_at: datetime) -> tuple:
+        row = json.loads(line)
+        row[1] = date.fromisoformat(row[1])
+        while len(row) < 8:  # spilled before payload_zlib / created_at existed
+            row.append(None)
+        if isinstance(row[6], dict):
+            row[6] = base64.b64decode(row[6]["b64"])
+        row[7] = datetime.fromisoformat(row[7]) if row[7] else fallback_created_at
+        return tuple(row)
+
+    def _quarantine(self, lines: List[str]) -> None:
+        """Unparseable spill lines (torn writes) are kept aside for a human, never retried."""
+        with self._spill_locked():
+            with open(self.spill_path + ".bad", "a", encoding="utf-8") as f:
+                f.writelines(line if line.endswith("\n") else line + "\n" for line in lines)
+        self.stats["quarantined"] += len(lines)
+        print(f"audit writer: quarantined {len(lines)} unreadable spill lines in {self.spill_path}.bad")
+
+    def _replay_spill(self) -> None:
+        """Moves the spill file aside and replays it (see _replay_file)."""
+        self._next_replay = time.monotonic() + SPILL_RETRY_SECONDS
+        with self._spill_locked():
+            if not os.path.exists(self.spill_path):
+                return
+            replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+            os.replace(self.spill_path, replay_path)
+        self._replay_file(replay_path)
+
+    def _replay_orphan(self, path: str) -> None:
+        """Claims a dead process's replay file (so a sibling worker starting too doesn't replay it twice)."""
+        own_path = f"{self.spill_path}.{os.getpid()}.replay"
+        with self._spill_locked():
+            if not os.path.exists(path):
+                return  # another worker got it first
+            if path != own_path:
+                os.replace(path, own_path)
+        self._replay_file(own_path)
+
+    def _replay_file(self, replay_path: str) -> None:
+        """Inserts a moved-aside spill file in batches; whatever fails goes back to the spill file."""
+        # Rows from before created_at was spilled: the file's mtime is the closest we have
+        age = max(0.0, time.time() - os.path.getmtime(replay_path))
+        fallback_created_at = get_storage().now() - timedelta(seconds=int(age))
+        rows, bad = [], []
+        with open(replay_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(self._parse_spill_line(line, fallback_created_at))
+                except (ValueError, TypeError, KeyError, IndexError):
+                    bad.append(line)
+        if bad:
+            self._quarantine(bad)
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                self._insert(batch)
+            except Exception as e:
+                print(f"audit writer: spill replay failed ({e}); keeping {len(rows) - start} rows")
+                self._spill(rows[start:])
+                self.stats["spilled"] -= len(rows) - start  # re-spilled, not new
+                break
+            self.stats["replayed"] += len(batch)
+        os.remove(replay_path)
+
+    # ---- shutdown ----
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stops the flusher and writes (or spills) everything still queued."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(items), self.batch_size):
+            self._write(items[start:start + self.batch_size])
+
+
+_writer: Optional[AuditWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer() -> AuditWriter:
+    """Process-wide writer, started on first use; flushed at interpreter exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+
+def flush_audit_writer() -> None:
+    """Durable flush for shutdown hooks / CLI scripts (no-op if nothing was logged)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
@@ -0,0 +1,133 @@
+# src/bm25_index.py
+
+from __future__ import annotations
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+BM25_PATH = "data/bm25_index.json"
+
+# Keeps short lab tokens intact: "Free T4" -> ["free", "t4"], "HbA1c" -> ["hba1c"]
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Small in-process inverted index (Okapi BM25) over the local corpus chunks.
+    Stores the chunk text + metadata too, so hits can be rendered without a Chroma round trip.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.docs: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}  # term -> {doc_index: term_freq}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc_id: str, text: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        idx = len(self.ids)
+        tokens = tokenize(text)
+        self.ids.append(doc_id)
+        self.docs.append(text)
+        self.metas.append(meta or {})
+        self.doc_lens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, {})[idx] = tf
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Returns [(doc_index, score)] best first. Only documents sharing a term with the query are scored.
+        """
+        n = len(self.ids)
+        if n == 0:
+            return []
+        avg_len = (sum(self.doc_lens) / n) or 1.0
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1.0 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for idx, tf in plist.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lens[idx] / avg_len)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+    # ---------- persistence ----------
+
+    def save(self, path: str = BM25_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "docs": self.docs,
+            "metas": self.metas,
+            "doc_lens": self.doc_lens,
+            # JSON keys must be strings
+            "postings": {t: {str(i): tf for i, tf in pl.items()} for t, pl in self.postings.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = BM25_PATH) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.ids = payload["ids"]
+        index.docs = payload["docs"]
+        index.metas = payload["metas"]
+        index.doc_lens = payload["doc_lens"]
+        index.postings = {t: {int(i): tf for i, tf in pl.items()} for t, pl in payload["postings"].items()}
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Standard RRF: score(d) = sum over rankings of 1 / (k + rank(d)), rank starting at 1.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+_index: Optional[BM25Index] = None
+
+
+def get_bm25_index(path: str = BM25_PATH) -> Optional[BM25Index]:
+    """
+    Loaded once per process; None if the ingest script hasn't built it yet.
+    """
+    global _index
+    if _index is None and os.path.exists(path):
+        _index = BM25Index.load(path)
+    return _index
+
+
+def set_bm25_index(index: BM25Index) -> None:
+    """Used by the ingest script so the freshly built index is used in the same process."""
+    global _index
+    _index = index
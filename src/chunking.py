@@ -0,0 +1,95 @@
+# src/chunking.py
+
+from __future__ import annotations
+import glob
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Corpus chunking shared by ingest_corpus (incl. its worker processes) and the benchmarks.
+# Deliberately import-light: no model, no Chroma client.
+
+CORPUS_DIR = "data/medical_corpus"
+
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+MIN_CHUNK_CHARS = 50
+
+# Bump when the chunking rules (or the chunk id scheme) change, so every file gets re-chunked once
+CHUNKER_VERSION = f"paragraph-v2:{CHUNK_SIZE}/{CHUNK_OVERLAP}"
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    text = text.replace("\x00", " ").strip()
+    chunks = []
+    i = 0
+    while i < len(text):
+        chunks.append(text[i:i + chunk_size])
+        i += (chunk_size - overlap)
+    return [c.strip() for c in chunks if c.strip()]
+
+
+def chunk_document(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split by paragraph; paragraphs longer than chunk_size (plain .txt dumps)
+    are further split with the sliding window from chunk_text.
+    """
+    chunks = []
+    for para in text.replace("\x00", " ").split("\n\n"):
+        para = para.strip()
+        if len(para) <= MIN_CHUNK_CHARS:
+            continue
+        if len(para) > chunk_size:
+            chunks.extend(chunk_text(para, chunk_size, overlap))
+        else:
+            chunks.append(para)
+    return chunks
+
+
+def chunk_id(fname: str, chunk_hash: str, occurrence: int = 0) -> str:
+    """
+    Content-keyed: a chunk keeps its id when text is inserted or removed around it,
+    so incremental ingest only embeds chunks whose text actually changed.
+    The n-th repeat of identical text within one file gets a _<n> suffix.
+    """
+    base = f"{fname}_chunk_{chunk_hash[:16]}"
+    return f"{base}_{occurrence}" if occurrence else base
+
+
+def chunk_ids(fname: str, chunk_hashes: List[str]) -> List[str]:
+    """chunk_id for every chunk of one file, in order (occurrence counters for duplicates)."""
+    seen: Dict[str, int] = {}
+    ids = []
+    for h in chunk_hashes:
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        ids.append(chunk_id(fname, h, n))
+    return ids
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def list_corpus_files(corpus_dir: str = CORPUS_DIR) -> List[str]:
+    return sorted(
+        glob.glob(os.path.join(corpus_dir, "*.md")) +
+        glob.glob(os.path.join(corpus_dir, "*.txt"))
+    )
+
+
+def read_and_chunk(job: Tuple[str, Optional[str]]) -> Tuple[str, str, Optional[List[Tuple[str, str]]]]:
+    """
+    Read + hash one file and, unless it matches the hash we already have, chunk it.
+    Top-level in a side-effect-free module so worker processes stay cheap.
+    Returns (fname, file_hash, [(chunk, chunk_hash)] or None if unchanged).
+    """
+    fpath, known_hash = job
+    fname = os.path.basename(fpath)
+    with open(fpath, "rb") as f:
+        raw = f.read()
+    file_hash = sha256_hex(raw)
+    if file_hash == known_hash:
+        return fname, file_hash, None
+    chunks = chunk_document(raw.decode("utf-8", errors="ignore"))
+    return fname, file_hash, [(c, sha256_hex(c.encode("utf-8"))) for c in chunks]
@@ -9,6 +9,21 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # --- Tavily (Knowledge Tool) ---
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+# Search backend behind web_medical_knowledge_with_sources:
+#   tavily (default) | record (tavily + save every response) | replay (serve saved responses, no network)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "tavily").lower()
+SEARCH_FIXTURES_DIR = os.getenv("SEARCH_FIXTURES_DIR", "data/search_fixtures")
+SEARCH_REPLAY_LATENCY_MS = float(os.getenv("SEARCH_REPLAY_LATENCY_MS", "0"))
+SEARCH_REPLAY_JITTER_MS = float(os.getenv("SEARCH_REPLAY_JITTER_MS", "0"))
+SEARCH_REPLAY_ERROR_RATE = float(os.getenv("SEARCH_REPLAY_ERROR_RATE", "0"))  # 0.0 - 1.0
+# knowledge_source="hybrid-budgeted": web results are only merged if they arrive within this budget
+WEB_SEARCH_BUDGET_MS = int(os.getenv("WEB_SEARCH_BUDGET_MS", "1500"))
+WEB_SEARCH_WORKERS = int(os.getenv("WEB_SEARCH_WORKERS", "4"))  # concurrent searches per request
+
+# --- Database ---
+# "mysql" (default) or "sqlite" (embedded single-file DB in WAL mode, no DB server; see src/storage.py)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/patient_report_intel.db")
 
 # --- MySQL Database ---
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -16,3 +31,65 @@ MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
 MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
 MYSQL_DB = os.getenv("MYSQL_DB", "patient_report_intel")
+# Process-wide connection pool (src/db.py)
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))                # connections kept open
+MYSQL_POOL_MAX_OVERFLOW = int(os.getenv("MYSQL_POOL_MAX_OVERFLOW", "10"))  # extra, closed when returned
+MYSQL_POOL_RECYCLE = int(os.getenv("MYSQL_POOL_RECYCLE", "1800"))       # seconds; reopen older connections
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "30"))       # seconds to wait when exhausted
+# Apply pending schema migrations when the API starts (else run: python -m src.scripts.migrate)
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# --- Embeddings ---
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+# "torch" (sentence-transformers) or "onnx" (onnxruntime on CPU, see src/scripts/export_onnx_model.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", "data/onnx/all-MiniLM-L6-v2")
+EMBED_ONNX_QUANTIZED = os.getenv("EMBED_ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+# Persistent query/text embedding cache (memory-mapped, LRU). Size 0 disables it.
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "data/embedding_cache")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "50000"))
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float32")  # float32 | float16
+
+# --- Retrieval ---
+# Vector store for local retrieval: "chroma" (default), "numpy" (exact, small corpora)
+# or "faiss" (exact flat index below FAISS_IVF_MIN_VECTORS, approximate IVF index with
+# memory-mapped inverted lists above it). numpy/faiss are exports built by ingest_corpus.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
+FAISS_IVF_MIN_VECTORS = int(os.getenv("FAISS_IVF_MIN_VECTORS", "20000"))
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # IVF clusters; 0 = ~4 * sqrt(n)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # clusters searched per query (recall vs speed)
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "50000"))  # vectors used to train the IVF quantizer
+# In-process LRU caches for local retrieval / Tavily results (entries, per process; 0 disables, e.g. for load tests)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+# Max tokens of packed evidence per abnormal test in the summarizer prompt
+KNOWLEDGE_CONTEXT_TOKEN_BUDGET = int(os.getenv("KNOWLEDGE_CONTEXT_TOKEN_BUDGET", "350"))
+
+# --- Warm-up ---
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_CODES = [c.strip().upper() for c in os.getenv("WARMUP_CODES", "").split(",") if c.strip()]  # empty = defaults
+# Also pre-fetch web results. Off by default for live Tavily (every warm-up would be paid
+# searches); replayed/recorded results cost nothing, so those are warmed unless disabled.
+WARMUP_WEB = os.getenv("WARMUP_WEB", "true" if SEARCH_BACKEND == "replay" else "false").lower() in ("1", "true", "yes")
+# Also ask the LLM for the specialists of codes outside the static table (one paid call per
+# such code and start; the answers are cached in-process anyway once a report needs them).
+WARMUP_LLM = os.getenv("WARMUP_LLM", "false").lower() in ("1", "true", "yes")
+WARMUP_AUDIT_LIMIT = int(os.getenv("WARMUP_AUDIT_LIMIT", "200"))  # recent audit_logs rows scanned for codes
+
+# --- Audit log ---
+# "buffered" (default): audit rows are queued and written in batches by a background thread
+# (src/audit_writer.py); "sync": written before the response returns, as before
+AUDIT_WRITE_MODE = os.getenv("AUDIT_WRITE_MODE", "buffered").lower()
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))          # rows; overflow goes to the spill file
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))            # rows per multi-row INSERT
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "500"))  # max time a row waits in the queue
+# JSONL file for rows that couldn't be written (DB down); replayed once the DB is back
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "data/audit_spill.jsonl")
+# zlib-compress trends_json + knowledge_sources_json into audit_logs.payload_zlib (escalation_json stays plain JSON)
+AUDIT_COMPRESS_PAYLOADS = os.getenv("AUDIT_COMPRESS_PAYLOADS", "false").lower() in ("1", "true", "yes")
+# Retention job (python -m src.scripts.archive_audit_logs): months kept in audit_logs (0 = forever);
+# older months are exported to AUDIT_ARCHIVE_DIR as gzipped JSONL, then dropped
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "data/audit_archive")
+# MySQL: monthly partitions created ahead of time (the rest lands in pmax until the job runs)
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "3"))
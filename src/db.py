@@ -1,7 +1,10 @@
 # src/db.py
 
-import mysql.connector
-from mysql.connector import errorcode
+import atexit
+import queue
+import threading
+import time
+import weakref
 from typing import Optional, List, Dict
 from src.config import (
     MYSQL_HOST,
@@ -9,13 +12,20 @@ from src.config import (
     MYSQL_USER,
     MYSQL_PASSWORD,
     MYSQL_DB,
+    MYSQL_POOL_SIZE,
+    MYSQL_POOL_MAX_OVERFLOW,
+    MYSQL_POOL_RECYCLE,
+    MYSQL_POOL_TIMEOUT,
 )
+from src.storage import get_storage
 
 def get_raw_connection(database: Optional[str] = None):
     """
     Connect to MySQL. If `database` is None, connect without selecting DB
     (used for creating the DB).
     """
+    import mysql.connector  # only needed for DB_BACKEND=mysql
+
     conn = mysql.connector.connect(
         host=MYSQL_HOST,
         port=MYSQL_PORT,
@@ -35,77 +45,159 @@ def ensure_database():
     cur.close()
     conn.close()
 
+
+# ---------- Connection pool ----------
+
+class PooledConnection:
+    """
+    Wraps a mysql.connector connection; everything is delegated except close(),
+    which hands the connection back to the pool. Existing `conn.close()` calls
+    in the helpers therefore keep working unchanged.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn, created_at: float):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+        self._released = False
+        # A checkout dropped without close() (e.g. a helper that raised before it) would
+        # otherwise hold its slot in the pool's count forever; discard it once collected.
+        self._finalizer = weakref.finalize(self, pool._discard, conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._finalizer.detach()
+            self._pool._release(self._conn, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool (`size` idle connections kept) that can grow by `max_overflow`
+    under load; overflow connections are closed when returned. Connections older
+    than `recycle` seconds are reopened on checkout (MySQL wait_timeout), and idle
+    ones are pinged first so a connection the server dropped is never handed out.
+    """
+
+    def __init__(self, size: int, max_overflow: int, recycle: int, timeout: float):
+        self.size = max(1, size)
+        self.max_overflow = max(0, max_overflow)
+        self.recycle = recycle
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0  # idle + checked out
+
+    def _connect(self):
+        return get_raw_connection(database=MYSQL_DB), time.monotonic()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                conn, created_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open < self.size + self.max_overflow
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    try:
+                        conn, created_at = self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    return PooledConnection(self, conn, created_at)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"MySQL pool exhausted ({self.size} + {self.max_overflow} overflow connections in use)"
+                    )
+                try:
+                    conn, created_at = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if self.recycle > 0 and time.monotonic() - created_at > self.recycle:
+                self._discard(conn)
+                continue
+            try:
+                conn.ping(reconnect=False)  # server restart / killed connection / network blip
+            except Exception:
+                self._discard(conn)
+                continue
+            return PooledConnection(self, conn, created_at)
+
+    def _release(self, conn, created_at: float):
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # never hand out a half-finished transaction
+        except Exception:
+            self._discard(conn)
+            return
+        if self._idle.qsize() >= self.size:
+            self._discard(conn)  # overflow connection
+            return
+        self._idle.put((conn, created_at))
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool; the database itself is created once, on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                ensure_database()
+                _pool = ConnectionPool(MYSQL_POOL_SIZE, MYSQL_POOL_MAX_OVERFLOW, MYSQL_POOL_RECYCLE, MYSQL_POOL_TIMEOUT)
+                atexit.register(_pool.close_all)
+    return _pool
+
+
 def get_connection():
     """
-    Get a connection to the project database (assumes it exists).
+    Borrow a connection to the project database: from the MySQL pool, or a
+    fresh SQLite connection when DB_BACKEND=sqlite (see src/storage.py).
+    Call .close() (or use `with`) to give it back.
     """
-    ensure_database()
-    conn = get_raw_connection(database=MYSQL_DB)
-    return conn
+    return get_storage().connect()
 
 def init_db():
     """
     Create tables if they don't exist.
+    Kept for older scripts; the schema is owned by src/migrations.py.
     """
-    ensure_database()
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Patients table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS patients (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        external_id VARCHAR(64) UNIQUE,
-        name VARCHAR(255),
-        sex ENUM('M','F','O'),
-        dob DATE
-    ) ENGINE=InnoDB;
-    """)
-
-    # Lab tests master
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS lab_tests (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        code VARCHAR(32) UNIQUE,
-        name VARCHAR(255),
-        unit_default VARCHAR(32),
-        description TEXT
-    ) ENGINE=InnoDB;
-    """)
-
-    # Lab results (time-series)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS lab_results (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        patient_id INT NOT NULL,
-        test_id INT NOT NULL,
-        value DOUBLE NOT NULL,
-        unit VARCHAR(32),
-        flag ENUM('High','Low','Normal') NULL,
-        result_date DATE NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        CONSTRAINT fk_lab_patient FOREIGN KEY (patient_id) REFERENCES patients(id),
-        CONSTRAINT fk_lab_test FOREIGN KEY (test_id) REFERENCES lab_tests(id)
-    ) ENGINE=InnoDB;
-    """)
-
-    # Audit Logs
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS audit_logs (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        patient_id VARCHAR(64),
-        report_date DATE,
-        abnormal_tests_count INT,
-        trends_json JSON,
-        escalation_json JSON,
-        knowledge_sources_json JSON,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    ) ENGINE=InnoDB;
-    """)
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    from src.migrations import run_migrations_once
+    run_migrations_once()
 
 def insert_patient(external_id: str, name: str, sex: str, dob: str) -> int:
     """
@@ -113,53 +205,47 @@ def insert_patient(external_id: str, name: str, sex: str, dob: str) -> int:
     dob: 'YYYY-MM-DD'
     """
     conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-
-    # Try to fetch existing
-    cur.execute("SELECT id FROM patients WHERE external_id = %s;", (external_id,))
-    row = cur.fetchone()
-    if row:
-        patient_id = row["id"]
-    else:
-        cur.execute(
-            """
-            INSERT INTO patients (external_id, name, sex, dob)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (external_id, name, sex, dob),
-        )
-        conn.commit()
-        patient_id = cur.lastrowid
-
-    cur.close()
-    conn.close()
-    return patient_id
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            # Try to fetch existing
+            cur.execute("SELECT id FROM patients WHERE external_id = %s;", (external_id,))
+            row = cur.fetchone()
+            if row:
+                return row["id"]
+            cur.execute(
+                """
+                INSERT INTO patients (external_id, name, sex, dob)
+                VALUES (%s, %s, %s, %s);
+                """,
+                (external_id, name, sex, dob),
+            )
+            conn.commit()
+            return cur.lastrowid
+    finally:
+        conn.close()
 
 def insert_lab_test(code: str, name: str, unit_default: str, description: str = "") -> int:
     """
     Insert a lab test if not exists; return its ID.
     """
     conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("SELECT id FROM lab_tests WHERE code = %s;", (code,))
-    row = cur.fetchone()
-    if row:
-        test_id = row["id"]
-    else:
-        cur.execute(
-            """
-            INSERT INTO lab_tests (code, name, unit_default, description)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (code, name, unit_default, description),
-        )
-        conn.commit()
-        test_id = cur.lastrowid
-
-    cur.close()
-    conn.close()
-    return test_id
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("SELECT id FROM lab_tests WHERE code = %s;", (code,))
+            row = cur.fetchone()
+            if row:
+                return row["id"]
+            cur.execute(
+                """
+                INSERT INTO lab_tests (code, name, unit_default, description)
+                VALUES (%s, %s, %s, %s);
+                """,
+                (code, name, unit_default, description),
+            )
+            conn.commit()
+            return cur.lastrowid
+    finally:
+        conn.close()
 
 def insert_lab_result(
     patient_id: int,
@@ -174,31 +260,30 @@ def insert_lab_result(
     result_date: 'YYYY-MM-DD'
     """
     conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        INSERT INTO lab_results (patient_id, test_id, value, unit, flag, result_date)
-        VALUES (%s, %s, %s, %s, %s, %s);
-        """,
-        (patient_id, test_id, value, unit, flag, result_date),
-    )
-    conn.commit()
-    row_id = cur.lastrowid
-
-    cur.close()
-    conn.close()
-    return row_id
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO lab_results (patient_id, test_id, value, unit, flag, result_date)
+                VALUES (%s, %s, %s, %s, %s, %s);
+                """,
+                (patient_id, test_id, value, unit, flag, result_date),
+            )
+            conn.commit()
+            return cur.lastrowid
+    finally:
+        conn.close()
 
 
 def get_patient_id_by_external_id(external_id: str) -> Optional[int]:
     conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT id FROM patients WHERE external_id = %s;", (external_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    return row["id"] if row else None
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("SELECT id FROM patients WHERE external_id = %s;", (external_id,))
+            row = cur.fetchone()
+        return row["id"] if row else None
+    finally:
+        conn.close()
 
 def fetch_lab_history_for_patient(patient_id: int) -> List[Dict]:
     """
@@ -206,27 +291,27 @@ def fetch_lab_history_for_patient(patient_id: int) -> List[Dict]:
     Each row: {code, name, value, unit, flag, result_date}
     """
     conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute(
-        """
-        SELECT
-            lt.code,
-            lt.name,
-            lr.value,
-            lr.unit,
-            lr.flag,
-            lr.result_date
-        FROM lab_results lr
-        JOIN lab_tests lt ON lr.test_id = lt.id
-        WHERE lr.patient_id = %s
-        ORDER BY lt.code, lr.result_date;
-        """,
-        (patient_id,),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(
+                """
+                SELECT
+                    lt.code,
+                    lt.name,
+                    lr.value,
+                    lr.unit,
+                    lr.flag,
+                    lr.result_date
+                FROM lab_results lr
+                JOIN lab_tests lt ON lr.test_id = lt.id
+                WHERE lr.patient_id = %s
+                ORDER BY lt.code, lr.result_date;
+                """,
+                (patient_id,),
+            )
+            return cur.fetchall()
+    finally:
+        conn.close()
 
 
 def insert_feedback(report_id: str, rating: str):
@@ -234,21 +319,12 @@ def insert_feedback(report_id: str, rating: str):
     Inserts feedback (thumbs up/down) into report_feedback table.
     """
     conn = get_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS report_feedback (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        report_id VARCHAR(255),
-        rating VARCHAR(50),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    ) ENGINE=InnoDB;
-    """)
-    
-    cur.execute(
-        "INSERT INTO report_feedback (report_id, rating) VALUES (%s, %s);",
-        (report_id, rating)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO report_feedback (report_id, rating) VALUES (%s, %s);",
+                (report_id, rating)
+            )
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,173 @@
+# src/db_async.py
+
+from __future__ import annotations
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from src.config import (
+    MYSQL_HOST,
+    MYSQL_PORT,
+    MYSQL_USER,
+    MYSQL_PASSWORD,
+    MYSQL_DB,
+    MYSQL_POOL_SIZE,
+    MYSQL_POOL_MAX_OVERFLOW,
+    MYSQL_POOL_RECYCLE,
+    MYSQL_POOL_TIMEOUT,
+)
+from src.storage import get_storage
+from src.audit_logger import AUDIT_LOG_INSERT_SQL, audit_log_row, insert_audit_log
+from src.graph.report_store import _to_date, patient_upsert_sql, report_upsert_sql, upsert_patient, create_or_get_report
+from src.patient_profile_store import PROFILE_SELECT_SQL, profile_from_row, get_profile
+from src.trends_db import HISTORY_SQL, fetch_last_results_for_patient
+
+# Async twins of the DB helpers the graph calls on every request, same arguments
+# and return shapes. With DB_BACKEND=mysql they run on an aiomysql pool (one per
+# event loop, sized like the sync pool); with sqlite the local, sub-millisecond
+# sync helpers run via asyncio.to_thread.
+
+# Keyed by the loop object itself (ids of dead loops get reused). aiomysql pools hold a
+# reference to their loop, so entries of loops closed without close_async_pool() are
+# pruned explicitly in _drop_closed_loops().
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def _drop_closed_loops() -> None:
+    for loop in [l for l in list(_pools.keys()) if l.is_closed()]:
+        pool = _pools.pop(loop, None)
+        try:
+            pool.terminate()  # can't await wait_closed() on a dead loop; just drop the sockets
+        except Exception:
+            pass
+
+
+async def get_async_pool():
+    """aiomysql pool for the running event loop (created on first use)."""
+    import aiomysql  # only needed for async DB access with DB_BACKEND=mysql
+
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        _drop_closed_loops()
+        from src.db import ensure_database
+        await asyncio.to_thread(ensure_database)
+        pool = await aiomysql.create_pool(
+            host=MYSQL_HOST,
+            port=MYSQL_PORT,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD,
+            db=MYSQL_DB,
+            minsize=1,  # grows on demand up to size + overflow
+            maxsize=MYSQL_POOL_SIZE + MYSQL_POOL_MAX_OVERFLOW,
+            pool_recycle=MYSQL_POOL_RECYCLE,
+            autocommit=False,
+        )
+        existing = _pools.setdefault(loop, pool)
+        if existing is not pool:  # another task won the race
+            pool.close()
+            await pool.wait_closed()
+            pool = existing
+    return pool
+
+
+async def close_async_pool() -> None:
+    """Close the running loop's pool (call on shutdown of an async server)."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+
+
+@asynccontextmanager
+async def async_connection() -> AsyncIterator[Any]:
+    """
+    Borrow an aiomysql connection; always returned to the pool outside a transaction.
+    With autocommit off even a plain SELECT opens one: aiomysql closes connections
+    released mid-transaction (the pool would reconnect on every call), and a kept one
+    would serve a stale REPEATABLE READ snapshot. So anything not committed by the
+    helper - reads, or writes that failed - is rolled back here, like the sync pool does.
+    """
+    pool = await get_async_pool()
+    conn = await asyncio.wait_for(pool.acquire(), timeout=MYSQL_POOL_TIMEOUT)
+    try:
+        yield conn
+    finally:
+        try:
+            if conn.get_transaction_status():
+                await conn.rollback()
+        except Exception:
+            conn.close()  # broken connection: release() drops closed ones
+        pool.release(conn)
+
+
+def _use_threads() -> bool:
+    return get_storage().name != "mysql"
+
+
+async def upsert_patient_async(external_id: str, name: str, sex: str, dob: str) -> int:
+    if _use_threads():
+        return await asyncio.to_thread(upsert_patient, external_id, name, sex, dob)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(patient_upsert_sql(), (external_id, name, sex, _to_date(dob)))
+            await conn.commit()
+            await cur.execute("SELECT id FROM patients_new WHERE external_id=%s", (external_id,))
+            row = await cur.fetchone()
+            return int(row[0]) if row else 0
+
+
+async def create_or_get_report_async(patient_db_id: int, report_date: str, source: str = "pdf") -> int:
+    if _use_threads():
+        return await asyncio.to_thread(create_or_get_report, patient_db_id, report_date, source)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(report_upsert_sql(), (patient_db_id, _to_date(report_date), source))
+            await conn.commit()
+            await cur.execute(
+                "SELECT id FROM reports WHERE patient_id=%s AND report_date=%s",
+                (patient_db_id, _to_date(report_date)),
+            )
+            row = await cur.fetchone()
+            return int(row[0]) if row else 0
+
+
+async def fetch_last_results_for_patient_async(external_id: str, limit_reports: int = 5) -> List[Dict[str, Any]]:
+    if _use_threads():
+        return await asyncio.to_thread(fetch_last_results_for_patient, external_id, limit_reports)
+    import aiomysql
+
+    async with async_connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(HISTORY_SQL, (external_id, limit_reports))
+            return list(await cur.fetchall() or [])
+
+
+async def insert_audit_log_async(
+    patient_id: str,
+    report_date: str,
+    abnormal_tests_count: int,
+    trends: Optional[Dict[str, Any]],
+    enriched_tests: List[Dict[str, Any]],
+) -> None:
+    if _use_threads():
+        return await asyncio.to_thread(
+            insert_audit_log, patient_id, report_date, abnormal_tests_count, trends, enriched_tests
+        )
+    row = audit_log_row(patient_id, report_date, abnormal_tests_count, trends, enriched_tests)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(AUDIT_LOG_INSERT_SQL, row)
+        await conn.commit()
+
+
+async def get_profile_async(patient_id: str) -> Dict[str, str]:
+    if _use_threads():
+        return await asyncio.to_thread(get_profile, patient_id)
+    import aiomysql
+
+    async with async_connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute(PROFILE_SELECT_SQL, (patient_id,))
+            return profile_from_row(await cur.fetchone())
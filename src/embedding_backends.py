@@ -0,0 +1,137 @@
+# src/embedding_backends.py
+
+from __future__ import annotations
+import json
+import os
+from typing import Any, List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.config import (
+    EMBED_BACKEND,
+    EMBED_MODEL_NAME,
+    EMBED_ONNX_DIR,
+    EMBED_ONNX_QUANTIZED,
+)
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+ONNX_INFO_FILE = "export_info.json"  # {"model_name", "max_seq_length"}, written by export_onnx_model
+MAX_SEQ_LENGTH = 256  # same as SentenceTransformer("all-MiniLM-L6-v2").max_seq_length
+
+
+def _model_basename(model_name: str) -> str:
+    return model_name.rstrip("/").split("/")[-1]
+
+
+def onnx_export_info(model_dir: str) -> dict:
+    """
+    What was exported into `model_dir`. Exports made before export_info.json existed
+    are identified by the directory name (data/onnx/<model>, the default layout).
+    """
+    try:
+        with open(os.path.join(model_dir, ONNX_INFO_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"model_name": os.path.basename(os.path.normpath(model_dir)), "max_seq_length": MAX_SEQ_LENGTH}
+
+
+class OnnxSentenceEncoder:
+    """
+    CPU-only replacement for SentenceTransformer("all-MiniLM-L6-v2").encode().
+
+    Runs the exported transformer through onnxruntime and applies the same
+    post-processing as the sentence-transformers pipeline (mean pooling over the
+    attention mask + L2 normalisation), so vectors land in the same space as the
+    ones already stored in Chroma.
+    Build the model files with: python -m src.scripts.export_onnx_model
+    """
+
+    def __init__(self, model_dir: str = EMBED_ONNX_DIR, quantized: bool = EMBED_ONNX_QUANTIZED,
+                 model_name: Optional[str] = EMBED_MODEL_NAME):
+        info = onnx_export_info(model_dir)
+        exported = str(info.get("model_name") or "")
+        if model_name and _model_basename(exported) != _model_basename(model_name):
+            # a different model's vectors would silently mix embedding spaces with the stored ones
+            raise ValueError(
+                f"{model_dir} holds an ONNX export of {exported!r}, not {model_name!r}. Run "
+                f"`python -m src.scripts.export_onnx_model --model {model_name} --out-dir <dir>` "
+                f"and point EMBED_ONNX_DIR at it."
+            )
+        self.model_name = exported
+
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FP32_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"{model_file} not found. Run `python -m src.scripts.export_onnx_model` first."
+            )
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_file, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.quantized = quantized
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(info.get("max_seq_length") or MAX_SEQ_LENGTH))
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return (pooled / norms).astype(np.float32)
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batches.append(self._encode_batch(texts[start:start + batch_size]))
+            if show_progress_bar:
+                print(f"  encoded {min(start + batch_size, len(texts))}/{len(texts)}")
+
+        out = np.vstack(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return out[0] if single else out
+
+
+def backend_cache_name(model_name: str, backend: str = EMBED_BACKEND,
+                       quantized: bool = EMBED_ONNX_QUANTIZED) -> str:
+    """
+    Name used to key the embedding cache. int8 vectors differ slightly from the
+    PyTorch ones, so each backend variant gets its own cache entries.
+    """
+    if backend == "onnx":
+        return f"{model_name}@onnx-int8" if quantized else f"{model_name}@onnx"
+    return model_name
+
+
+def load_embedding_model(model_name: str, backend: str = EMBED_BACKEND) -> Any:
+    """
+    Returns an object with a SentenceTransformer-compatible .encode().
+    backend: "torch" (sentence-transformers, default) | "onnx" (onnxruntime, CPU)
+    """
+    if backend == "onnx":
+        return OnnxSentenceEncoder(model_name=model_name)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    raise ValueError(f"Unknown EMBED_BACKEND {backend!r} (expected 'torch' or 'onnx')")
@@ -0,0 +1,252 @@
+# src/embedding_cache.py
+
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.config import (
+    EMBED_MODEL_NAME,
+    EMBED_CACHE_DIR,
+    EMBED_CACHE_SIZE,
+    EMBED_CACHE_DTYPE,
+    EMBED_BACKEND,
+)
+from src.embedding_backends import backend_cache_name, load_embedding_model
+
+_DIGEST_SIZE = 20  # sha1
+_FLUSH_EVERY = 256  # new vectors between index flushes
+
+# encode() kwargs accepted only at the value the cached path produces anyway
+_FIXED_ENCODE_KWARGS = {"convert_to_numpy": True, "convert_to_tensor": False}
+
+
+def text_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha1(f"{model_name}\x00{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed LRU of text embeddings for one model.
+
+    - vectors.bin: np.memmap (capacity x dim) of float32/float16 vectors
+    - keys.bin:    np.memmap (capacity x 20) of the sha1 key stored in each slot
+    - index.json:  key -> slot, in LRU order (oldest first)
+
+    keys.bin is checked on every hit, so a slot that another process has
+    re-used since we loaded the index is treated as a miss, never as a wrong vector.
+    """
+
+    def __init__(self, cache_dir: str, capacity: int, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"EMBED_CACHE_DTYPE must be float32 or float16, got {dtype!r}")
+        self.cache_dir = cache_dir
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._vectors: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._dirty = 0
+
+        meta = self._read_json(self._path("meta.json"))
+        if meta and meta.get("capacity") == self.capacity and meta.get("dtype") == self.dtype.name:
+            self._open(int(meta["dim"]), create=False)
+
+    # ---------- files ----------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path: str, payload: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _open(self, dim: int, create: bool) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        vec_path, key_path = self._path("vectors.bin"), self._path("keys.bin")
+        expected = self.capacity * dim * self.dtype.itemsize
+        if create or not os.path.exists(vec_path) or os.path.getsize(vec_path) != expected:
+            mode = "w+"
+        else:
+            mode = "r+"
+
+        self.dim = dim
+        self._vectors = np.memmap(vec_path, dtype=self.dtype, mode=mode, shape=(self.capacity, dim))
+        self._keys = np.memmap(key_path, dtype=np.uint8, mode=mode, shape=(self.capacity, _DIGEST_SIZE))
+
+        self._lru.clear()
+        if mode == "r+":
+            index = self._read_json(self._path("index.json")) or {}
+            for hex_key, slot in index.get("entries", []):
+                if 0 <= slot < self.capacity:
+                    self._lru[bytes.fromhex(hex_key)] = slot
+        else:
+            self._write_json(self._path("meta.json"), {
+                "dim": dim,
+                "capacity": self.capacity,
+                "dtype": self.dtype.name,
+            })
+
+        used = set(self._lru.values())
+        self._free = [s for s in range(self.capacity - 1, -1, -1) if s not in used]
+
+    # ---------- lookups ----------
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """
+        Returns {position_in_keys: float32 vector} for the keys that are cached.
+        """
+        found: Dict[int, np.ndarray] = {}
+        if self._vectors is None:
+            return found
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                slot = self._lru.get(key)
+                if slot is None:
+                    continue
+                if self._keys[slot].tobytes() != key:
+                    # slot was re-used by another process
+                    del self._lru[key]
+                    continue
+                self._lru.move_to_end(key)
+                found[i] = np.asarray(self._vectors[slot], dtype=np.float32)
+        return found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        if self.capacity <= 0 or len(keys) == 0:
+            return
+
+        with self._lock:
+            if self._vectors is None:
+                self._open(int(vectors.shape[1]), create=True)
+
+            for key, vec in zip(keys, vectors):
+                slot = self._lru.get(key)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    else:
+                        _, slot = self._lru.popitem(last=False)  # evict least recently used
+                self._vectors[slot] = vec
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._lru[key] = slot
+                self._lru.move_to_end(key)
+                self._dirty += 1
+
+            if self._dirty >= _FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._vectors is None or not self._dirty:
+            return
+        self._vectors.flush()
+        self._keys.flush()
+        self._write_json(self._path("index.json"), {
+            "entries": [[k.hex(), slot] for k, slot in self._lru.items()],
+        })
+        self._dirty = 0
+
+
+class CachedEncoder:
+    """
+    Drop-in for SentenceTransformer.encode() that goes through an EmbeddingCache.
+    Always returns float32 numpy (a 1-D vector for a single string, like the original).
+    The cache holds raw model output; normalize_embeddings is applied on the way out.
+    Other options that would change the result (tensors, precision, ...) raise TypeError
+    instead of being silently ignored.
+    """
+
+    def __init__(self, model: Any, model_name: str, cache: Optional[EmbeddingCache]):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        unsupported = sorted(k for k, v in kwargs.items() if k not in _FIXED_ENCODE_KWARGS or _FIXED_ENCODE_KWARGS[k] != v)
+        if unsupported:
+            raise TypeError(f"CachedEncoder.encode() does not support {', '.join(unsupported)}")
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        keys = [text_key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(keys) if self.cache else {}
+
+        missing = [i for i in range(len(texts)) if i not in found]
+        if missing:
+            new_vecs = np.asarray(
+                self.model.encode(
+                    [texts[i] for i in missing],
+                    batch_size=batch_size,
+                    show_progress_bar=show_progress_bar,
+                    convert_to_numpy=True,
+                ),
+                dtype=np.float32,
+            )
+            if self.cache:
+                self.cache.put_many([keys[i] for i in missing], new_vecs)
+            for j, i in enumerate(missing):
+                found[i] = new_vecs[j]
+
+        out = np.vstack([found[i] for i in range(len(texts))])
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out = out / np.maximum(norms, 1e-12)
+        return out[0] if single else out
+
+
+_encoders: Dict[str, CachedEncoder] = {}
+_encoders_lock = threading.Lock()
+
+
+def _cache_dir_for(model_name: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(EMBED_CACHE_DIR, safe)
+
+
+def get_cached_encoder(model_name: str = EMBED_MODEL_NAME, backend: str = EMBED_BACKEND) -> CachedEncoder:
+    """
+    Process-wide encoder for `model_name` on the configured backend (see
+    src/embedding_backends.py): the model is loaded once and shared by the
+    retriever, ingest scripts and scoring scripts, all backed by the same on-disk cache.
+    """
+    cache_name = backend_cache_name(model_name, backend)
+    with _encoders_lock:
+        enc = _encoders.get(cache_name)
+        if enc is None:
+            cache = None
+            if EMBED_CACHE_SIZE > 0:
+                cache = EmbeddingCache(_cache_dir_for(cache_name), EMBED_CACHE_SIZE, EMBED_CACHE_DTYPE)
+                atexit.register(cache.flush)
+            enc = CachedEncoder(load_embedding_model(model_name, backend), cache_name, cache)
+            _encoders[cache_name] = enc
+        return enc
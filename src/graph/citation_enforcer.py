@@ -1,7 +1,9 @@
 # src/graph/citation_enforcer.py
 
 from __future__ import annotations
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit, urlunsplit
+import hashlib
 import re
 
 REF_PATTERN = re.compile(r"Ref\s+(\d+)", re.IGNORECASE)
@@ -17,6 +19,83 @@ def extract_used_ref_ids(text: str) -> List[int]:
     return sorted(ids)
 
 
+def citation_key(source: Dict[str, Any]) -> str:
+    """
+    De-duplication key for a source.
+    - web: normalised URL (scheme/host lower-cased, no fragment, no trailing slash)
+    - local: the local:// URL as-is (it already pins file + chunk)
+    - no URL: hash of title + snippet
+    """
+    url = (source.get("url") or "").strip()
+    if url:
+        if url.startswith("local://"):
+            return url
+        parts = urlsplit(url)
+        path = parts.path.rstrip("/")
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+    raw = f"{source.get('title') or ''}\x00{source.get('snippet') or ''}"
+    return "text:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def build_citation_index(citations: List[Dict[str, Any]]) -> Dict[str, int]:
+    """key -> ref_id for an existing shared citation table."""
+    index: Dict[str, int] = {}
+    for c in citations:
+        if c.get("ref_id") is not None:
+            index.setdefault(citation_key(c), int(c["ref_id"]))
+    return index
+
+
+def register_citation(
+    citations: List[Dict[str, Any]],
+    index: Dict[str, int],
+    source: Dict[str, Any],
+    source_type: str,
+) -> int:
+    """
+    Returns the ref_id of `source` in the shared table, adding it only if the
+    same URL / local chunk isn't already cited.
+    """
+    key = citation_key(source)
+    rid = index.get(key)
+    if rid is not None:
+        return rid
+
+    rid = max((int(c["ref_id"]) for c in citations if c.get("ref_id") is not None), default=0) + 1
+    citations.append({
+        "ref_id": rid,
+        "title": source.get("title", "Source"),
+        "url": source.get("url", ""),
+        "snippet": (source.get("snippet") or "")[:200],  # truncate snippet
+        "source_type": source_type,
+    })
+    index[key] = rid
+    return rid
+
+
+def format_citation_table(
+    citations: List[Dict[str, Any]],
+    only_ids: Optional[List[int]] = None,
+    snippet_chars: int = 350,
+) -> str:
+    """
+    Prompt-side rendering of the shared table: each reference appears once,
+    no matter how many tests use it.
+    """
+    allowed = set(only_ids) if only_ids is not None else None
+    lines = []
+    for c in citations:
+        rid = c.get("ref_id")
+        if rid is None or (allowed is not None and rid not in allowed):
+            continue
+        line = f"[Ref {rid}] {c.get('title') or 'Source'}\nURL: {c.get('url') or ''}\n"
+        if snippet_chars > 0:
+            line += f"Snippet: {(c.get('snippet') or '').strip()[:snippet_chars]}\n"
+        lines.append(line)
+    return "\n".join(lines)
+
+
 def build_references_block(citations: List[Dict[str, Any]], only_ids: List[int] | None = None) -> str:
     if not citations:
         return ""
@@ -24,6 +103,7 @@ def build_references_block(citations: List[Dict[str, Any]], only_ids: List[int]
     allowed = set(only_ids) if only_ids else None
 
     lines = ["\n### References"]
+    seen: Set[str] = set()
     for c in citations:
         rid = c.get("ref_id")
         if rid is None:
@@ -31,6 +111,12 @@ def build_references_block(citations: List[Dict[str, Any]], only_ids: List[int]
         if allowed is not None and rid not in allowed:
             continue
 
+        # one line per distinct source, even if an older state carries duplicates
+        key = citation_key(c)
+        if key in seen:
+            continue
+        seen.add(key)
+
         title = c.get("title") or "Source"
         url = c.get("url") or ""
 
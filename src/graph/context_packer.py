@@ -0,0 +1,119 @@
+# src/graph/context_packer.py
+
+from __future__ import annotations
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from src.bm25_index import tokenize
+
+# Words that signal a passage is about the abnormal direction we care about
+DIRECTION_TERMS = {
+    "high": {"high", "elevated", "increased", "raised", "excess", "above", "overload"},
+    "low": {"low", "decreased", "reduced", "deficiency", "deficient", "below", "anemia"},
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_MIN_SENTENCE_CHARS = 20
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken count when available, otherwise the usual ~4 chars/token estimate."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in _SENTENCE_SPLIT.split(text or ""):
+        if part.lstrip().startswith("#"):
+            continue  # markdown headers carry no facts
+        # strip bullets / numbering left over from the corpus
+        s = re.sub(r"^\s*([-*•]|\d+[.)])\s*", "", part).strip()
+        if len(s) >= _MIN_SENTENCE_CHARS:
+            sentences.append(s)
+    return sentences
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_context(
+    passages: Sequence[Tuple[int, str]],
+    test_name: str,
+    code: str = "",
+    direction: Optional[str] = None,
+    budget_tokens: int = 350,
+    mmr_lambda: float = 0.7,
+) -> str:
+    """
+    Packs retrieved passages [(ref_id, text)] into at most `budget_tokens` tokens:
+      1. split into sentences, each keeping its ref_id
+      2. score against the test name/code (+ direction words, weighted lower)
+      3. greedy maximal-marginal-relevance selection to drop near-duplicates
+    Output lines look like "[Ref 3] sentence", in selection order.
+    """
+    name_terms = set(tokenize(f"{test_name} {code}"))
+    dir_terms = DIRECTION_TERMS.get(direction or "", set())
+
+    candidates: List[Dict] = []
+    seen_text: Set[str] = set()
+    for ref_id, text in passages:
+        for sent in split_sentences(text):
+            norm = sent.lower()
+            if norm in seen_text:
+                continue
+            seen_text.add(norm)
+
+            terms = set(tokenize(sent))
+            if not terms:
+                continue
+            hits = len(terms & name_terms) + 0.5 * len(terms & dir_terms)
+            if hits <= 0:
+                continue
+            candidates.append({
+                "ref_id": ref_id,
+                "text": sent,
+                "terms": terms,
+                "relevance": hits / math.sqrt(len(terms)),
+                "tokens": estimate_tokens(sent) + 4,  # + "[Ref N] "
+            })
+
+    if not candidates:
+        return ""
+
+    max_rel = max(c["relevance"] for c in candidates)
+    for c in candidates:
+        c["relevance"] /= max_rel
+
+    selected: List[Dict] = []
+    used = 0
+    while candidates:
+        best, best_score = None, float("-inf")
+        for c in candidates:
+            if used + c["tokens"] > budget_tokens:
+                continue
+            redundancy = max((_jaccard(c["terms"], s["terms"]) for s in selected), default=0.0)
+            score = mmr_lambda * c["relevance"] - (1 - mmr_lambda) * redundancy
+            if score > best_score:
+                best, best_score = c, score
+        if best is None:
+            break
+        selected.append(best)
+        used += best["tokens"]
+        candidates.remove(best)
+
+    return "\n".join(f"[Ref {c['ref_id']}] {c['text']}" for c in selected)
@@ -3,19 +3,14 @@
 from typing import Dict, Any, List
 from datetime import date
 from src.graph.state import ReportState
-from src.db import (
-    init_db,
-    insert_patient,
-    insert_lab_test,
-    insert_lab_result,
-    get_patient_id_by_external_id,
-    fetch_lab_history_for_patient,
-)
 from src.graph.citation_enforcer import (
     extract_used_ref_ids,
     build_references_block,
     remove_existing_references_section,
     validate_ref_ids,
+    build_citation_index,
+    register_citation,
+    format_citation_table,
 )
 
 from src.knowledge_tool import web_medical_knowledge_with_sources
@@ -24,10 +19,26 @@ from src.specialist_recommender import recommend_specialist_for_test_code
 from src.llm import get_llm
 from src.normalization.unit_ranges import normalize_test_row
 from src.audit_logger import insert_audit_log
-from src.graph.report_store import persist_report
-from src.trends_db import fetch_last_results_for_patient, compute_trends_from_rows, fetch_series_for_patient, compute_long_trend
+from src.audit_writer import get_audit_writer
+from src.graph.report_store import persist_reports
+from src.trends_db import (
+    fetch_last_results_for_patient,
+    compute_trends_from_rows,
+    fetch_series_for_patient,
+    compute_long_trend,
+    build_series_from_rows,
+    history_for_state,
+    fetch_latest_results,
+    trends_from_latest,
+    series_from_latest,
+)
 from src.clinical_trends import clinical_label
 from src.local_knowledge_tool import local_medical_knowledge_with_sources
+from src.knowledge_bundles import lookup_bundle, direction_for_test, query_name, local_query, web_query
+from src.graph.context_packer import pack_context
+from src.config import KNOWLEDGE_CONTEXT_TOKEN_BUDGET, WEB_SEARCH_BUDGET_MS, WEB_SEARCH_WORKERS, AUDIT_WRITE_MODE
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # ---------- Helper: trend computation (same logic as pipeline_with_trends) ----------
 
@@ -84,60 +95,6 @@ from src.local_knowledge_tool import local_medical_knowledge_with_sources
 
 # ---------- Node 1: Ingest reports into DB ----------
 
-def ingest_reports_node(state: ReportState) -> ReportState:
-    """
-    - Initializes DB
-    - Inserts patient
-    - Inserts all tests from previous & current report into MySQL
-    """
-    logs = state.get("logs", [])
-    logs.append("ingest_reports_node: initializing DB and inserting reports")
-
-    init_db()
-
-    current = state["current_report"]
-    patient_info = current["patient"]
-    patient_id = insert_patient(
-        external_id=patient_info["external_id"],
-        name=patient_info["name"],
-        sex=patient_info["sex"],
-        dob=patient_info["dob"],
-    )
-
-    # Helper to insert tests from one report
-    def _insert_from_report(report: Dict[str, Any]):
-        report_date = report["report_date"]
-        for t in report["tests"]:
-            test_id = insert_lab_test(
-                code=t["code"],
-                name=t["name"],
-                unit_default=t["unit"],
-                description=f"{t['name']} ({t['unit']})",
-            )
-            insert_lab_result(
-                patient_id=patient_id,
-                test_id=test_id,
-                value=float(t["value"]),
-                unit=t["unit"],
-                flag=t["flag"],
-                result_date=report_date,
-            )
-
-    # Insert previous (if any) then current
-    previous = state.get("previous_report")
-    if previous:
-        _insert_from_report(previous)
-    _insert_from_report(current)
-
-    logs.append("ingest_reports_node: finished inserting into DB")
-
-    new_state: ReportState = {
-        "patient": patient_info,
-        "logs": logs,
-    }
-    return new_state
-
-
 # ---------- Node 2: Identify abnormal tests from current report ----------
 
 def abnormal_filter_node(state: ReportState) -> ReportState:
@@ -246,18 +203,26 @@ def trend_node(state: ReportState) -> ReportState:
     logs = state.get("logs", [])
     logs.append("trend_node: computing trends + series from MySQL history")
 
-    patient = state["patient"]
-    external_id = patient["external_id"]
     current_date = state["current_report"]["report_date"]
 
-    #  fetch last N reports worth of rows
-    rows = fetch_last_results_for_patient(external_id, limit_reports=5)
+    #  short trend + series straight from patient_latest_results (maintained on write)
+    latest = fetch_latest_results(state["patient"]["external_id"])
+    trends = trends_from_latest(latest, current_date)
+    if trends is not None:
+        series_by_code = series_from_latest(latest)
+        source = "latest-results table"
+    else:
+        #  fallback: fetch last N reports worth of rows ONCE; trends, series and analysis share it
+        history = history_for_state(state, limit_reports=5)
+        rows = history["rows"]
+        state["history"] = history
 
-    #  short trend: current vs previous
-    trends = compute_trends_from_rows(rows, current_date)
+        #  short trend: current vs previous
+        trends = compute_trends_from_rows(rows, current_date)
 
-    #  series for charts (oldest->newest)
-    series_by_code = fetch_series_for_patient(external_id, lookback_reports=5)
+        #  series for charts (oldest->newest)
+        series_by_code = build_series_from_rows(rows)
+        source = "history query"
 
     #  attach long trend per code
     for code, tr in list(trends.items()):
@@ -282,11 +247,25 @@ def trend_node(state: ReportState) -> ReportState:
 
     state["trends"] = trends
     state["series_by_code"] = series_by_code
-    logs.append(f"trend_node: trends={len(trends)} codes, series={len(series_by_code)} codes")
+    logs.append(f"trend_node: trends={len(trends)} codes, series={len(series_by_code)} codes (from {source})")
     state["logs"] = logs
     return state
 
 
+# ---------- Knowledge source modes ----------
+# local           : local corpus only (no network)
+# web             : Tavily only
+# hybrid          : both, waits for web
+# hybrid-budgeted : local always; web merged only if it lands within the latency budget
+KNOWLEDGE_MODES = ("local", "web", "hybrid", "hybrid-budgeted")
+
+def _knowledge_mode(value: Any) -> str:
+    mode = str(value or "local").strip().lower()
+    if mode == "tavily":  # older clients
+        return "web"
+    return mode if mode in KNOWLEDGE_MODES else "local"
+
+
 # ---------- Node 4: Apply escalation rules + retrieve knowledge ----------
 
 
@@ -298,16 +277,42 @@ def escalation_and_knowledge_node(state: ReportState) -> ReportState:
     abnormal_tests = state["abnormal_tests"]
     trends = state.get("trends", {})
 
-    # 3) Knowledge Retrieval (Hybrid RAG: Local + Web)
+    # 3) Knowledge Retrieval (Local / Web / Hybrid, per knowledge_source)
     # Import locally to avoid top-level circular issues
-    from src.knowledge_tool import web_medical_knowledge_with_sources
-    from src.local_knowledge_tool import local_medical_knowledge_with_sources
+    from src.knowledge_tool import cached_web_medical_knowledge_with_sources
+    from src.local_knowledge_tool import cached_local_medical_knowledge_with_sources
+
+    mode = _knowledge_mode(state.get("knowledge_source"))
+    use_local = mode != "web"
+    use_web = mode != "local"
+    budget_ms = state.get("web_budget_ms")
+    if budget_ms is None:
+        budget_ms = WEB_SEARCH_BUDGET_MS
+    logs.append(f"escalation_and_knowledge_node: knowledge_source={mode}")
+
+    # Fire all web searches up front so they overlap with local retrieval and each other.
+    # Per-request executor: a search that misses the budget keeps running (and fills the
+    # search cache) on this request's threads, never in front of another request's searches.
+    started = time.monotonic()
+    web_futures = {}
+    web_pool = None
+    if use_web and abnormal_tests:
+        web_pool = ThreadPoolExecutor(
+            max_workers=min(len(abnormal_tests), WEB_SEARCH_WORKERS), thread_name_prefix="web-search"
+        )
+        for t in abnormal_tests:
+            q = web_query(
+                query_name(t["code"], t.get("name")),
+                direction_for_test(t),
+                urgent=(t.get("classification") == "Urgent"),
+            )
+            web_futures[id(t)] = web_pool.submit(cached_web_medical_knowledge_with_sources, query=q, max_results=3)
 
     enriched_tests = []
     
-    # Global citations list
+    # Shared citation table: one entry per distinct URL / local chunk
     citations = state.get("citations", []) or []
-    next_ref_id = (citations[-1]["ref_id"] + 1) if citations else 1
+    citation_index = build_citation_index(citations)
 
     for t in abnormal_tests:
         # Helper to safely float cast ranges
@@ -323,45 +328,55 @@ def escalation_and_knowledge_node(state: ReportState) -> ReportState:
         )
 
         test_name = t.get("name")
-        val = t.get("value")
-        classification = t.get("classification", "Abnormal")
-        is_urgent = (classification == "Urgent")
         
         # A) Local Retrieval (Gold Standard)
-        local_context, local_sources = local_medical_knowledge_with_sources(
-            query=f"{test_name} {val} clinical guidelines", 
-            k=2
-        )
-
-        # B) Web Retrieval (Broad)
-        web_query = f"{test_name} high value {val} causes and treatment"
-        if is_urgent:
-             web_query += " urgent guidelines"
-
-        web_context, web_sources = web_medical_knowledge_with_sources(
-            query=web_query, 
-            max_results=3
-        )
+        # Known codes come from the precomputed bundles (no embedding work);
+        # unknown codes fall back to vector search.
+        local_sources = []
+        if use_local:
+            bundle = lookup_bundle(t["code"], direction_for_test(t))
+            if bundle is not None:
+                local_context, local_sources = bundle
+                logs.append(f"Local RAG for {test_name}: precomputed bundle hit")
+            else:
+                local_context, local_sources = cached_local_medical_knowledge_with_sources(
+                    query=local_query(query_name(t["code"], test_name), direction_for_test(t)),
+                    k=2
+                )
+
+        # B) Web Retrieval (Broad) - already in flight
+        web_sources = []
+        future = web_futures.get(id(t))
+        if future is not None:
+            if mode == "hybrid-budgeted":
+                remaining = budget_ms / 1000.0 - (time.monotonic() - started)
+                try:
+                    web_context, web_sources = future.result(timeout=max(0.0, remaining))
+                except FutureTimeoutError:
+                    future.cancel()  # no-op if already running; a queued one never starts
+                    logs.append(f"Web RAG for {test_name}: dropped, over {budget_ms} ms budget")
+                except Exception as e:
+                    logs.append(f"Web RAG for {test_name}: failed ({e}), using local only")
+            else:
+                web_context, web_sources = future.result()
         
-        combined_context = f"**Local Guidelines:**\n{local_context}\n\n**Web Search:**\n{web_context}"
-        
-        # Merge sources and assign Ref IDs
+        # Map this test's sources onto shared Ref IDs (de-duplicated across tests)
         this_test_ref_ids = []
-        all_new_sources = local_sources + web_sources
-        
-        for s in all_new_sources:
-            # Check if URL already cited? For now, we allow dupes or unique by URL
-            # Simple approach: always add new citation
-            c_obj = {
-                "ref_id": next_ref_id,
-                "title": s.get("title", "Source"),
-                "url": s.get("url", ""),
-                "snippet": s.get("snippet", "")[:200], # truncate snippet
-                "source_type": "local" if s in local_sources else "web"
-            }
-            citations.append(c_obj)
-            this_test_ref_ids.append(next_ref_id)
-            next_ref_id += 1
+        passages = []
+        for s, source_type in [(s, "local") for s in local_sources] + [(s, "web") for s in web_sources]:
+            rid = register_citation(citations, citation_index, s, source_type)
+            if rid not in this_test_ref_ids:
+                this_test_ref_ids.append(rid)
+            passages.append((rid, s.get("content") or s.get("snippet") or ""))
+
+        # Ranked, de-duplicated sentences within a per-test token budget (Ref ids kept inline)
+        combined_context = pack_context(
+            passages,
+            test_name=test_name or t["code"],
+            code=t["code"],
+            direction=direction_for_test(t),
+            budget_tokens=KNOWLEDGE_CONTEXT_TOKEN_BUDGET,
+        )
 
         trend_info = trends.get(t["code"])
 
@@ -375,9 +390,11 @@ def escalation_and_knowledge_node(state: ReportState) -> ReportState:
             }
         )
         
-        logs.append(f"Hybrid RAG for {test_name}: {len(local_sources)} local + {len(web_sources)} web sources")
+        logs.append(f"RAG ({mode}) for {test_name}: {len(local_sources)} local + {len(web_sources)} web sources")
 
-    logs.append(f"escalation_and_knowledge_node: enriched {len(enriched_tests)} tests")
+    if web_pool is not None:
+        web_pool.shutdown(wait=False, cancel_futures=True)  # don't wait for searches past the budget
+    logs.append(f"escalation_and_knowledge_node: enriched {len(enriched_tests)} tests, {len(citations)} unique citations")
 
     state["enriched_tests"] = enriched_tests
     state["citations"] = citations
@@ -720,6 +737,7 @@ def summarizer_node(state: ReportState) -> ReportState:
     # Build per-test blocks (with clinical_trend)
     # --------------------------
     test_blocks: List[str] = []
+    used_ref_ids = set()
 
     for et in enriched_tests:
         t = et.get("test", {}) or {}
@@ -773,21 +791,11 @@ def summarizer_node(state: ReportState) -> ReportState:
                 f"trend_direction={trend_direction} | clinical_trend={clinical_trend}{series_line}"
             )
 
-        # Allowed refs for THIS test only
-        ref_ids = et.get("ref_ids", []) or []
-        allowed_refs = [citations_by_id[rid] for rid in ref_ids if rid in citations_by_id]
-
-        refs_block_lines: List[str] = []
-        for r in allowed_refs:
-            rid = r.get("ref_id")
-            title = r.get("title", "Source")
-            url = r.get("url", "")
-            snippet = (r.get("snippet") or "").strip()
-            snippet = snippet[:350]
-            refs_block_lines.append(
-                f"[Ref {rid}] {title}\nURL: {url}\nSnippet: {snippet}\n"
-            )
-        refs_block = "\n".join(refs_block_lines) if refs_block_lines else "No references provided for this test."
+        # Allowed refs for THIS test only (ids into the shared REFERENCE TABLE)
+        ref_ids = [rid for rid in (et.get("ref_ids", []) or []) if rid in citations_by_id]
+        used_ref_ids.update(ref_ids)
+        allowed_refs_line = ", ".join(f"[Ref {rid}]" for rid in ref_ids) if ref_ids else "None provided for this test."
+        evidence = (et.get("knowledge_context") or "").strip() or "No retrieved evidence for this test."
 
         test_blocks.append(
             f"""
@@ -803,13 +811,20 @@ TEST:
 TREND (source-of-truth provided by system):
 - {trend_line}
 
-ALLOWED REFERENCES (you may cite ONLY these using inline [Ref N]):
-{refs_block}
+ALLOWED REFERENCES (you may cite ONLY these using inline [Ref N]; details in REFERENCE TABLE):
+{allowed_refs_line}
+
+EVIDENCE (retrieved, each line tagged with its [Ref N]):
+{evidence}
 """.strip()
         )
 
     combined_tests_block = "\n\n".join(test_blocks)
 
+    # Each shared reference is listed once, however many tests use it
+    # (no snippets: the packed EVIDENCE already carries the text)
+    reference_table = format_citation_table(citations, only_ids=sorted(used_ref_ids), snippet_chars=0) or "No references available."
+
     # --------------------------
     # Prompts (strict citations + clinical_trend rule)
     # --------------------------
@@ -887,6 +902,9 @@ IMPORTANT:
 
 DATA:
 {combined_tests_block}
+
+REFERENCE TABLE:
+{reference_table}
 """.strip()
 
     response = llm.invoke(
@@ -1117,6 +1135,9 @@ def analysis_node(state: ReportState) -> ReportState:
     abnormal_tests = state.get("abnormal_tests", []) or []
     trends: Dict[str, Any] = state.get("trends", {}) or {}
     series_by_code: Dict[str, List[Dict[str, Any]]] = state.get("series_by_code", {}) or {}
+    if not series_by_code and state.get("history"):
+        # trend_node already fetched the history; rebuild series from it, no extra query
+        series_by_code = build_series_from_rows(state["history"]["rows"])
 
     # Support both storage styles:
     escalations: Dict[str, Any] = state.get("escalations", {}) or {}
@@ -1300,7 +1321,7 @@ def citation_enforcer_node(state: ReportState) -> ReportState:
 
 def audit_logger_node(state: ReportState) -> ReportState:
     logs = state.get("logs", [])
-    logs.append("audit_logger_node: inserting audit log row")
+    logs.append(f"audit_logger_node: writing audit log row ({AUDIT_WRITE_MODE})")
 
     patient = state.get("patient", {})
     patient_id = patient.get("external_id") or patient.get("patient_id") or "UNKNOWN"
@@ -1310,8 +1331,9 @@ def audit_logger_node(state: ReportState) -> ReportState:
     trends = state.get("trends", {}) or {}
     enriched_tests = state.get("enriched_tests", []) or []
 
-    # Insert audit row
-    insert_audit_log(
+    # Buffered: enqueue only; serialisation + batched INSERT happen in the audit writer thread
+    write = get_audit_writer().submit if AUDIT_WRITE_MODE == "buffered" else insert_audit_log
+    write(
         patient_id=str(patient_id),
         report_date=str(report_date),
         abnormal_tests_count=len(abnormal_tests),
@@ -1319,22 +1341,35 @@ def audit_logger_node(state: ReportState) -> ReportState:
         enriched_tests=enriched_tests,
     )
 
-    logs.append("audit_logger_node: audit log inserted")
+    logs.append("audit_logger_node: audit log queued" if AUDIT_WRITE_MODE == "buffered" else "audit_logger_node: audit log inserted")
     state["logs"] = logs
     return state
 
 def db_persist_node(state: ReportState) -> ReportState:
+    """
+    Single persistence step (entry point of the graph): writes the reports to
+    patients_new / reports / test_results, the schema trends_db reads from.
+    The legacy patients / lab_tests / lab_results tables are no longer written
+    (migration 4 backfilled them).
+    """
     logs = state.get("logs", [])
     logs.append("db_persist_node: persisting reports to MySQL")
 
     curr = state["current_report"]
     prev = state.get("previous_report")
 
-    persist_report(curr, source="pdf_or_json")
-    if prev:
-        persist_report(prev, source="pdf_or_json")
+    # Older report first so the current one is written last; one transaction,
+    # reports already stored unchanged are skipped
+    reports = ([prev] if prev else []) + [curr]
+    results = persist_reports(reports, source="pdf_or_json")
 
-    logs.append("db_persist_node: persistence done")
+    summary = ", ".join(
+        f"{r['report_id']}:{r['status']}"
+        + (f" (+{r['inserted']} ~{r['updated']} -{r['deleted']})" if r["status"] != "unchanged" else "")
+        for r in results
+    )
+    logs.append(f"db_persist_node: persistence done [{summary}]")
+    state["patient"] = state.get("patient") or curr["patient"]
     state["logs"] = logs
     return state
 
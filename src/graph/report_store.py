@@ -1,28 +1,46 @@
 # src/report_store.py
 
 from __future__ import annotations
-from typing import Any, Dict, Tuple, Optional
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple, Optional
 from datetime import datetime
 from src.db import get_connection
+from src.storage import get_storage
+
+
+# Rolling window (values per code) kept in patient_latest_results, same depth as the trend lookback
+LATEST_WINDOW = 5
+
+LATEST_COLUMNS = (
+    "patient_id", "code", "name", "last_value", "last_unit", "last_date",
+    "prev_value", "prev_unit", "prev_date", "normal_range_low", "normal_range_high",
+    "n_values", "mean_value", "min_value", "max_value", "recent_json",
+)
 
 
 def _to_date(val: str):
     return datetime.strptime(val.strip(), "%Y-%m-%d").date()
 
 
+def patient_upsert_sql() -> str:
+    return get_storage().upsert_sql(
+        "patients_new", ("external_id", "name", "sex", "dob"), ("external_id",), ("name", "sex", "dob")
+    )
+
+
+def report_upsert_sql() -> str:
+    return get_storage().upsert_sql(
+        "reports", ("patient_id", "report_date", "source"), ("patient_id", "report_date"), ("source",)
+    )
+
+
 def upsert_patient(external_id: str, name: str, sex: str, dob: str) -> int:
     conn = get_connection()
     try:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO patients_new (external_id, name, sex, dob)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                  name = VALUES(name),
-                  sex = VALUES(sex),
-                  dob = VALUES(dob)
-                """,
+                patient_upsert_sql(),
                 (external_id, name, sex, _to_date(dob))
             )
             conn.commit()
@@ -39,11 +57,7 @@ def create_or_get_report(patient_db_id: int, report_date: str, source: str = "pd
     try:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO reports (patient_id, report_date, source)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE source = VALUES(source)
-                """,
+                report_upsert_sql(),
                 (patient_db_id, _to_date(report_date), source)
             )
             conn.commit()
@@ -58,34 +72,280 @@ def create_or_get_report(patient_db_id: int, report_date: str, source: str = "pd
         conn.close()
 
 
+def _test_result_row(report_id: int, t: dict) -> tuple:
+    return (
+        report_id,
+        str(t.get("code")),
+        str(t.get("name")),
+        float(t.get("value")) if t.get("value") is not None else None,
+        str(t.get("unit")),
+        float(t.get("normal_range_low")) if t.get("normal_range_low") is not None else None,
+        float(t.get("normal_range_high")) if t.get("normal_range_high") is not None else None,
+        str(t.get("flag")),
+    )
+
+
 def replace_test_results(report_id: int, tests: list[dict]) -> None:
     """
     For simplicity: delete existing results for this report and re-insert.
+    One transaction; the rows go in as a single multi-row INSERT (executemany).
     """
     conn = get_connection()
     try:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM test_results WHERE report_id=%s", (report_id,))
-            for t in tests:
-                cur.execute(
+            if tests:
+                cur.executemany(
                     """
                     INSERT INTO test_results
                       (report_id, code, name, value, unit, normal_range_low, normal_range_high, flag)
                     VALUES
                       (%s, %s, %s, %s, %s, %s, %s, %s)
                     """,
-                    (
-                        report_id,
-                        str(t.get("code")),
-                        str(t.get("name")),
-                        float(t.get("value")) if t.get("value") is not None else None,
-                        str(t.get("unit")),
-                        float(t.get("normal_range_low")) if t.get("normal_range_low") is not None else None,
-                        float(t.get("normal_range_high")) if t.get("normal_range_high") is not None else None,
-                        str(t.get("flag")),
-                    )
+                    [_test_result_row(report_id, t) for t in tests],
                 )
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def report_content_hash(report: Dict[str, Any], source: str) -> str:
+    """sha256 over everything persist_report writes for this report (patient, source, result rows)."""
+    patient = report["patient"]
+    rows = sorted((list(_test_result_row(0, t)[1:]) for t in report.get("tests", [])), key=lambda r: json.dumps(r, default=str))
+    payload = {
+        "patient": [patient["external_id"], patient.get("name", ""), patient.get("sex", ""), patient.get("dob", "1980-01-01")],
+        "source": source,
+        "tests": rows,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _upsert_patient(cur, patient: Dict[str, Any]) -> int:
+    # Returns the id on duplicates too, no extra SELECT (LAST_INSERT_ID(id) / RETURNING id)
+    return get_storage().upsert_id(
+        cur,
+        "patients_new",
+        ("external_id", "name", "sex", "dob"),
+        (patient["external_id"], patient.get("name", ""), patient.get("sex", ""), _to_date(patient.get("dob", "1980-01-01"))),
+        ("external_id",),
+        ("name", "sex", "dob"),
+    )
+
+
+def _diff_test_results(cur, report_id: int, tests: List[dict]) -> Dict[str, int]:
+    """
+    Keyed diff on (report_id, code): insert new codes, update changed rows,
+    delete codes that disappeared (and duplicate rows for a code).
+    Unchanged rows aren't touched.
+    """
+    cur.execute(
+        """
+        SELECT id, code, name, value, unit, normal_range_low, normal_range_high, flag
+        FROM test_results WHERE report_id = %s
+        """ + get_storage().for_update,
+        (report_id,),
+    )
+    existing: Dict[str, Tuple[int, tuple]] = {}
+    delete_ids: List[int] = []
+    for row in cur.fetchall():
+        if row[1] in existing:
+            delete_ids.append(int(row[0]))
+        else:
+            existing[row[1]] = (int(row[0]), tuple(row[2:]))
+
+    wanted: Dict[str, tuple] = {}
+    for t in tests:
+        row = _test_result_row(report_id, t)
+        wanted[row[1]] = row  # last one wins for a repeated code
+
+    inserts, updates = [], []
+    for code, row in wanted.items():
+        if code not in existing:
+            inserts.append(row)
+        elif existing[code][1] != row[2:]:
+            updates.append(row[2:] + (existing[code][0],))
+    delete_ids.extend(row_id for code, (row_id, _) in existing.items() if code not in wanted)
+
+    if inserts:
+        cur.executemany(
+            """
+            INSERT INTO test_results
+              (report_id, code, name, value, unit, normal_range_low, normal_range_high, flag)
+            VALUES
+              (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            inserts,
+        )
+    if updates:
+        cur.executemany(
+            """
+            UPDATE test_results
+            SET name = %s, value = %s, unit = %s, normal_range_low = %s, normal_range_high = %s, flag = %s
+            WHERE id = %s
+            """,
+            updates,
+        )
+    if delete_ids:
+        placeholders = ", ".join(["%s"] * len(delete_ids))
+        cur.execute(f"DELETE FROM test_results WHERE id IN ({placeholders})", delete_ids)
+
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(delete_ids),
+        "codes": sorted(set(existing) | set(wanted)),
+    }
+
+
+def _persist_report(cur, report: Dict[str, Any], source: str) -> Dict[str, Any]:
+    content_hash = report_content_hash(report, source)
+    patient_db_id = _upsert_patient(cur, report["patient"])
+    report_date = _to_date(report["report_date"])
+
+    cur.execute(
+        "SELECT id, content_hash FROM reports WHERE patient_id=%s AND report_date=%s" + get_storage().for_update,
+        (patient_db_id, report_date),
+    )
+    row = cur.fetchone()
+    if row and row[1] == content_hash:
+        return {"patient_id": patient_db_id, "report_id": int(row[0]), "status": "unchanged"}
+
+    if row:
+        report_db_id = int(row[0])
+        cur.execute(
+            "UPDATE reports SET source=%s, content_hash=%s WHERE id=%s",
+            (source, content_hash, report_db_id),
+        )
+    else:
+        cur.execute(
+            "INSERT INTO reports (patient_id, report_date, source, content_hash) VALUES (%s, %s, %s, %s)",
+            (patient_db_id, report_date, source, content_hash),
+        )
+        report_db_id = int(cur.lastrowid)
+
+    diff = _diff_test_results(cur, report_db_id, report.get("tests", []))
+    refresh_latest_results(cur, patient_db_id, diff.pop("codes"))
+    return {"patient_id": patient_db_id, "report_id": report_db_id, "status": "updated" if row else "inserted", **diff}
+
+
+def refresh_latest_results(cur, patient_db_id: int, codes: Optional[List[str]] = None) -> int:
+    """
+    Recomputes patient_latest_results for `codes` (all of the patient's codes if None)
+    from test_results, on the caller's cursor/transaction. Returns rows written.
+    """
+    params: List[Any] = [patient_db_id]
+    code_filter = ""
+    if codes is not None:
+        if not codes:
+            return 0
+        code_filter = f"AND tr.code IN ({', '.join(['%s'] * len(codes))})"
+        params.extend(codes)
+    cur.execute(
+        f"""
+        SELECT tr.code, r.report_date, tr.name, tr.value, tr.unit, tr.normal_range_low, tr.normal_range_high
+        FROM reports r
+        JOIN test_results tr ON tr.report_id = r.id
+        WHERE r.patient_id = %s {code_filter}
+        ORDER BY tr.code, r.report_date DESC
+        """,
+        params,
+    )
+    by_code: Dict[str, List[tuple]] = {}
+    for row in cur.fetchall():
+        points = by_code.setdefault(row[0], [])
+        if len(points) < LATEST_WINDOW:
+            points.append(row)
+
+    upserts = []
+    for code, points in by_code.items():
+        last = points[0]
+        prev = points[1] if len(points) > 1 else None
+        values = [p[3] for p in points if p[3] is not None]
+        recent = [
+            {"date": str(p[1]), "value": p[3], "unit": p[4], "name": p[2] or code}
+            for p in reversed(points)  # oldest -> newest, like series_by_code
+        ]
+        upserts.append((
+            patient_db_id, code, last[2],
+            last[3], last[4], last[1],
+            prev[3] if prev else None, prev[4] if prev else None, prev[1] if prev else None,
+            last[5], last[6],
+            len(values),
+            sum(values) / len(values) if values else None,
+            min(values) if values else None,
+            max(values) if values else None,
+            json.dumps(recent),
+        ))
+
+    if upserts:
+        cur.executemany(
+            get_storage().upsert_sql(
+                "patient_latest_results",
+                LATEST_COLUMNS,
+                ("patient_id", "code"),
+                LATEST_COLUMNS[2:],
+                ["updated_at = CURRENT_TIMESTAMP"],
+            ),
+            upserts,
+        )
+
+    # codes that no longer have any result
+    gone = [c for c in (codes or []) if c not in by_code]
+    if gone:
+        cur.execute(
+            f"DELETE FROM patient_latest_results WHERE patient_id = %s AND code IN ({', '.join(['%s'] * len(gone))})",
+            [patient_db_id] + gone,
+        )
+    return len(upserts)
+
+
+def rebuild_latest_results(external_id: Optional[str] = None) -> int:
+    """
+    Backfills patient_latest_results from test_results, for one patient or everyone.
+    One transaction per patient. Returns the number of patients rebuilt.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            if external_id:
+                cur.execute("SELECT id FROM patients_new WHERE external_id = %s", (external_id,))
+            else:
+                cur.execute("SELECT id FROM patients_new ORDER BY id")
+            patient_ids = [int(r[0]) for r in cur.fetchall()]
+
+            for pid in patient_ids:
+                cur.execute("DELETE FROM patient_latest_results WHERE patient_id = %s", (pid,))
+                refresh_latest_results(cur, pid)
+                conn.commit()
+        return len(patient_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def persist_reports(reports: List[Dict[str, Any]], source: str = "pdf") -> List[Dict[str, Any]]:
+    """
+    Persists several report JSONs (e.g. previous + current) in ONE transaction.
+    Reports whose content hash matches what's stored are skipped entirely;
+    changed ones get a keyed diff of their test rows, and the touched codes in
+    patient_latest_results are refreshed in the same transaction.
+    Returns one {patient_id, report_id, status, inserted/updated/deleted} per report.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            results = [_persist_report(cur, r, source) for r in reports]
+        conn.commit()
+        return results
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
@@ -94,21 +354,9 @@ def persist_report(report: Dict[str, Any], source: str = "pdf") -> Tuple[int, in
     """
     Persists one report JSON:
       - upsert patient
-      - create/get report
-      - replace test results
+      - create/get report (skipped if its content hash is unchanged)
+      - diff test results
     Returns (patient_db_id, report_db_id)
     """
-    patient = report["patient"]
-    patient_db_id = upsert_patient(
-        external_id=patient["external_id"],
-        name=patient.get("name", ""),
-        sex=patient.get("sex", ""),
-        dob=patient.get("dob", "1980-01-01"),
-    )
-    report_db_id = create_or_get_report(
-        patient_db_id=patient_db_id,
-        report_date=report["report_date"],
-        source=source,
-    )
-    replace_test_results(report_db_id, report.get("tests", []))
-    return patient_db_id, report_db_id
+    res = persist_reports([report], source=source)[0]
+    return res["patient_id"], res["report_id"]
@@ -27,6 +27,7 @@ class ReportState(TypedDict, total=False):
     analysis: List[Dict[str, Any]]
     citations: List[Dict[str, Any]]
     series_by_code: Dict[str, Any]
+    history: Dict[str, Any]         # {external_id, limit_reports, rows}: fetched once by trend_node
     correlations: str
     action_plan: str
     
@@ -39,4 +40,5 @@ class ReportState(TypedDict, total=False):
     disable_critic: bool # For Ablation Studies
     original_name: str  # For PII masking logic
     
-    knowledge_source: str   # "tavily" or "local"
\ No newline at end of file
+    knowledge_source: str   # "local" | "web" (legacy: "tavily") | "hybrid" | "hybrid-budgeted"
+    web_budget_ms: Optional[int]  # per-request override of WEB_SEARCH_BUDGET_MS (hybrid-budgeted)
\ No newline at end of file
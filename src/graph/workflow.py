@@ -5,7 +5,6 @@ from src.graph.nodes import citation_enforcer_node
 
 from src.graph.state import ReportState
 from src.graph.nodes import (
-    ingest_reports_node,
     abnormal_filter_node,
     trend_node,
     escalation_and_knowledge_node,
@@ -34,7 +33,6 @@ def build_app():
     graph = StateGraph(ReportState)
 
     # Register nodes
-    graph.add_node("ingest_reports", ingest_reports_node)
     graph.add_node("abnormal_filter", abnormal_filter_node)
     graph.add_node("trend", trend_node)
     graph.add_node("escalation_and_knowledge", escalation_and_knowledge_node)
@@ -59,11 +57,9 @@ def build_app():
 
 
     # Set entry point
-    graph.set_entry_point("ingest_reports")
+    graph.set_entry_point("db_persist")
 
 # Define linear flow
-    graph.add_edge("ingest_reports", "db_persist")
-    
     # [PII] db_persist -> anonymizer -> unit_normalization
     graph.add_edge("db_persist", "anonymizer")
     graph.add_edge("anonymizer", "unit_normalization")
@@ -0,0 +1,144 @@
+# src/knowledge_bundles.py
+
+from __future__ import annotations
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BUNDLES_PATH = "data/knowledge_bundles.json"
+
+# Test codes covered by data/medical_corpus (CBC, anemia, iron studies, thyroid).
+# Name is what goes into the retrieval query, same as a report's test name would.
+BUNDLE_TESTS = {
+    "HGB": "Hemoglobin",
+    "HCT": "Hematocrit",
+    "RBC": "Red Blood Cell count",
+    "WBC": "White Blood Cell count",
+    "PLT": "Platelet count",
+    "MCV": "Mean Corpuscular Volume (MCV)",
+    "MCH": "Mean Corpuscular Hemoglobin (MCH)",
+    "MCHC": "Mean Corpuscular Hemoglobin Concentration (MCHC)",
+    "FERRITIN": "Ferritin",
+    "IRON": "Serum iron",
+    "TIBC": "Total Iron Binding Capacity (TIBC)",
+    "TSAT": "Transferrin saturation",
+    "TSH": "Thyroid Stimulating Hormone (TSH)",
+    "FT4": "Free T4",
+    "FT3": "Free T3",
+    "T4": "Thyroxine (T4)",
+    "T3": "Triiodothyronine (T3)",
+}
+
+DIRECTIONS = ("high", "low")
+
+_bundles: Optional[Dict[str, Any]] = None
+
+
+def bundle_key(code: str, direction: str) -> str:
+    return f"{(code or '').upper().strip()}:{direction}"
+
+
+def bundle_query(test_name: str, direction: str) -> str:
+    return f"{test_name} {direction} clinical guidelines"
+
+
+# Retrieval queries are value-free (name + direction only) so repeated tests hit
+# the retrieval / Tavily caches, and the startup warm-up can pre-populate them.
+
+def query_name(code: str, test_name: Optional[str] = None) -> str:
+    """Canonical name used in queries; report names vary ("Hb", "Haemoglobin"...)."""
+    return BUNDLE_TESTS.get((code or "").upper().strip()) or test_name or code
+
+
+def local_query(test_name: str, direction: Optional[str]) -> str:
+    return bundle_query(test_name, direction or "abnormal")
+
+
+def web_query(test_name: str, direction: Optional[str], urgent: bool = False) -> str:
+    q = f"{test_name} {direction or 'abnormal'} value causes and treatment"
+    if urgent:
+        q += " urgent guidelines"
+    return q
+
+
+def direction_for_test(test: Dict[str, Any]) -> Optional[str]:
+    """
+    'high' / 'low' for an abnormal test row, from its flag or (fallback) its range.
+    None if it can't be told.
+    """
+    flag = str(test.get("flag") or "").strip().lower()
+    if flag in DIRECTIONS:
+        return flag
+
+    try:
+        value = float(test.get("value"))
+    except (TypeError, ValueError):
+        return None
+
+    low = test.get("normal_range_low")
+    high = test.get("normal_range_high")
+    if high is not None and value > float(high):
+        return "high"
+    if low is not None and value < float(low):
+        return "low"
+    return None
+
+
+def build_bundles(
+    search_fn: Callable[..., Tuple[str, List[Dict[str, Any]]]],
+    k: int = 2,
+) -> Dict[str, Any]:
+    """
+    Runs `search_fn(query=..., k=...)` once for every known code + direction.
+    Each bundle keeps exactly what local_medical_knowledge_with_sources returns,
+    so the node can use it as a drop-in replacement.
+    """
+    bundles: Dict[str, Any] = {}
+    for code, name in BUNDLE_TESTS.items():
+        for direction in DIRECTIONS:
+            query = bundle_query(name, direction)
+            context, sources = search_fn(query=query, k=k)
+            bundles[bundle_key(code, direction)] = {
+                "query": query,
+                "context": context,
+                "sources": sources,
+            }
+    return bundles
+
+
+def save_bundles(bundles: Dict[str, Any], path: str = BUNDLES_PATH) -> None:
+    global _bundles
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(bundles, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    _bundles = bundles
+
+
+def load_bundles(path: str = BUNDLES_PATH) -> Dict[str, Any]:
+    """
+    Loaded once per process. Missing file -> empty dict (everything falls back to vector search).
+    """
+    global _bundles
+    if _bundles is None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _bundles = json.load(f)
+        except (OSError, ValueError):
+            _bundles = {}
+    return _bundles
+
+
+def lookup_bundle(code: str, direction: Optional[str]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    O(1) lookup of the precomputed (context, sources) for a known code + direction.
+    Returns None for unknown codes so the caller can fall back to vector search.
+    """
+    if not direction:
+        return None
+    bundle = load_bundles().get(bundle_key(code, direction))
+    if not bundle:
+        return None
+    # copies, so callers can't mutate the shared bundle
+    return bundle["context"], [dict(s) for s in bundle["sources"]]
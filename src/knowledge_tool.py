@@ -1,11 +1,84 @@
 # src/knowledge_tool.py
-from tavily import TavilyClient
-from src.config import TAVILY_API_KEY
+import hashlib
+import json
+import os
+import random
+import time
+from functools import lru_cache
+from src.config import (
+    TAVILY_API_KEY,
+    RETRIEVAL_CACHE_SIZE,
+    SEARCH_BACKEND,
+    SEARCH_FIXTURES_DIR,
+    SEARCH_REPLAY_LATENCY_MS,
+    SEARCH_REPLAY_JITTER_MS,
+    SEARCH_REPLAY_ERROR_RATE,
+)
 
-if not TAVILY_API_KEY:
-    raise ValueError("TAVILY_API_KEY not set in .env")
+_tavily_client = None
 
-tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+
+def _get_tavily_client():
+    # Created on first real search so replay mode works without a key (or the tavily package)
+    global _tavily_client
+    if _tavily_client is None:
+        if not TAVILY_API_KEY:
+            raise ValueError("TAVILY_API_KEY not set in .env (or use SEARCH_BACKEND=replay)")
+        from tavily import TavilyClient
+        _tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+    return _tavily_client
+
+
+# ---------- Search backends: tavily | record | replay ----------
+
+def fixture_key(params: dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _fixture_path(params: dict) -> str:
+    return os.path.join(SEARCH_FIXTURES_DIR, f"{fixture_key(params)}.json")
+
+
+def _record(params: dict, resp: dict) -> None:
+    os.makedirs(SEARCH_FIXTURES_DIR, exist_ok=True)
+    path = _fixture_path(params)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"request": params, "response": resp}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class SearchReplayError(RuntimeError):
+    """Injected failure in replay mode (stands in for a Tavily timeout / 5xx)."""
+
+
+def _replay(params: dict) -> dict:
+    """
+    Serves a recorded response from SEARCH_FIXTURES_DIR with simulated latency
+    (SEARCH_REPLAY_LATENCY_MS +/- SEARCH_REPLAY_JITTER_MS) and SEARCH_REPLAY_ERROR_RATE
+    injected failures. Unrecorded queries return no results.
+    """
+    delay_ms = SEARCH_REPLAY_LATENCY_MS + random.uniform(-SEARCH_REPLAY_JITTER_MS, SEARCH_REPLAY_JITTER_MS)
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+    if SEARCH_REPLAY_ERROR_RATE > 0 and random.random() < SEARCH_REPLAY_ERROR_RATE:
+        raise SearchReplayError(f"injected search failure for {params.get('query')!r}")
+
+    path = _fixture_path(params)
+    if not os.path.exists(path):
+        print(f"search replay: no fixture for {params.get('query')!r}")
+        return {"results": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["response"]
+
+
+def _search(**params) -> dict:
+    if SEARCH_BACKEND == "replay":
+        return _replay(params)
+    resp = _get_tavily_client().search(**params)
+    if SEARCH_BACKEND == "record":
+        _record(params, resp)
+    return resp
 
 
 def web_medical_knowledge(query: str, max_results: int = 4) -> str:
@@ -34,7 +107,7 @@ def web_medical_knowledge_with_sources(query: str, max_results: int = 4):
         "who.int"
     ]
 
-    resp = tavily_client.search(
+    resp = _search(
         query=query,
         max_results=max_results,
         search_depth="basic",
@@ -57,3 +130,18 @@ def web_medical_knowledge_with_sources(query: str, max_results: int = 4):
 
     context = "\n\n".join(chunks)
     return context, sources
+
+
+@lru_cache(maxsize=RETRIEVAL_CACHE_SIZE)
+def _cached_web(query: str, max_results: int):
+    context, sources = web_medical_knowledge_with_sources(query, max_results=max_results)
+    return context, tuple(sources)
+
+
+def cached_web_medical_knowledge_with_sources(query: str, max_results: int = 4):
+    """
+    Memoised Tavily search (per process). Failed searches aren't cached.
+    Queries should be value-free (see knowledge_bundles.web_query) to get hits.
+    """
+    context, sources = _cached_web(query, max_results)
+    return context, [dict(s) for s in sources]
@@ -1,33 +1,63 @@
 from typing import List, Dict, Tuple
+from functools import lru_cache
 import chromadb
-from sentence_transformers import SentenceTransformer
+from src.config import RETRIEVAL_CACHE_SIZE
+from src.embedding_cache import get_cached_encoder
+from src.bm25_index import get_bm25_index, reciprocal_rank_fusion
+from src.vector_store import get_vector_store
 
 PERSIST_DIR = "data/chroma_db"
 COLLECTION = "medical_knowledge"
 
+# Each retriever contributes this many candidates per requested hit before fusion
+CANDIDATES_PER_HIT = 3
+
 _client = chromadb.PersistentClient(path=PERSIST_DIR)
 _col = _client.get_or_create_collection(COLLECTION)
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+_model = get_cached_encoder()
+_store = get_vector_store(_col)  # chroma | numpy | faiss (VECTOR_STORE in config)
+
+
+def reload_vector_store():
+    """Called by the ingest scripts after they rebuild the numpy/faiss export."""
+    global _store
+    _store = get_vector_store(_col)
+    _cached_local.cache_clear()
+
 
 def local_medical_knowledge_with_sources(query: str, k: int = 4) -> Tuple[str, List[Dict]]:
+    """
+    Hybrid local retrieval: vector search (Chroma, or the numpy/faiss export) + BM25 over the same chunks,
+    fused with reciprocal rank fusion. BM25 catches exact lab terms
+    ("Free T4", "MCV", "ferritin") that short-chunk embeddings tend to miss.
+    Falls back to vector-only if the BM25 index hasn't been built.
+    """
+    n_candidates = k * CANDIDATES_PER_HIT
     q_emb = _model.encode([query]).tolist()[0]
 
-    res = _col.query(
-        query_embeddings=[q_emb],
-        n_results=k,
-        include=["documents", "metadatas"],
-    )
+    # id -> (text, meta) for everything either retriever returned
+    hits: Dict[str, Tuple[str, Dict]] = {}
+    vector_ranking = []
+    for doc_id, doc, meta in _store.query(q_emb, n_candidates):
+        hits[doc_id] = (doc, meta)
+        vector_ranking.append(doc_id)
+
+    bm25 = get_bm25_index()
+    if bm25 is not None:
+        bm25_ranking = []
+        for idx, _score in bm25.search(query, k=n_candidates):
+            doc_id = bm25.ids[idx]
+            hits.setdefault(doc_id, (bm25.docs[idx], bm25.metas[idx]))
+            bm25_ranking.append(doc_id)
+        ranked_ids = [doc_id for doc_id, _ in reciprocal_rank_fusion([vector_ranking, bm25_ranking])]
+    else:
+        ranked_ids = vector_ranking
 
     chunks = []
     sources = []
 
-    ids = res.get("ids", [[]])[0]
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-
-    for i in range(len(ids)):
-        text = docs[i] or ""
-        meta = metas[i] or {}
+    for i, doc_id in enumerate(ranked_ids[:k]):
+        text, meta = hits[doc_id]
         source_name = meta.get("source", "local_corpus")
         chunk_no = meta.get("chunk", i)
 
@@ -36,6 +66,7 @@ def local_medical_knowledge_with_sources(query: str, k: int = 4) -> Tuple[str, L
             "title": f"{source_name} (chunk {chunk_no})",
             "url": f"local://{source_name}#chunk={chunk_no}",
             "snippet": text[:400],
+            "content": text,  # full chunk, used by the context packer
         })
 
         chunks.append(
@@ -46,3 +77,15 @@ def local_medical_knowledge_with_sources(query: str, k: int = 4) -> Tuple[str, L
 
     context = "\n\n".join(chunks)
     return context, sources
+
+
+@lru_cache(maxsize=RETRIEVAL_CACHE_SIZE)
+def _cached_local(query: str, k: int) -> Tuple[str, Tuple[Dict, ...]]:
+    context, sources = local_medical_knowledge_with_sources(query, k)
+    return context, tuple(sources)
+
+
+def cached_local_medical_knowledge_with_sources(query: str, k: int = 4) -> Tuple[str, List[Dict]]:
+    """Memoised version of local_medical_knowledge_with_sources (fresh source dicts per call)."""
+    context, sources = _cached_local(query, k)
+    return context, [dict(s) for s in sources]
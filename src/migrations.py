@@ -0,0 +1,557 @@
+# src/migrations.py
+
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from src.db import get_connection
+from src.storage import get_storage
+from src.audit_retention import partition_audit_logs
+
+# Every table/index the app uses is created here, never on the request path.
+# A migration is (version, description, steps); a step is a SQL string or a
+# callable(cursor) for things MySQL can't express idempotently (e.g. ADD INDEX IF NOT EXISTS).
+# MIGRATIONS holds the MySQL steps; SQLITE_STEPS the same versions in SQLite's dialect.
+# Append new migrations at the end; never edit one that has shipped.
+
+Step = Union[str, Callable[[Any], None]]
+
+
+def _index_exists(cur, table: str, index: str) -> bool:
+    return get_storage().index_exists(cur, table, index)
+
+
+def add_index(table: str, index: str, ddl: str) -> Callable[[Any], None]:
+    """Step that runs `ddl` only if `index` isn't on `table` yet (tables created by hand, older installs)."""
+    def step(cur):
+        if not _index_exists(cur, table, index):
+            cur.execute(ddl)
+    step.__name__ = f"add_index_{index}"
+    return step
+
+
+def _column_exists(cur, table: str, column: str) -> bool:
+    return get_storage().column_exists(cur, table, column)
+
+
+def add_column(table: str, column: str, ddl: str) -> Callable[[Any], None]:
+    """Step that runs `ddl` only if `table` doesn't have `column` yet."""
+    def step(cur):
+        if not _column_exists(cur, table, column):
+            cur.execute(ddl)
+    step.__name__ = f"add_column_{table}_{column}"
+    return step
+
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "legacy tables: patients, lab_tests, lab_results, audit_logs", [
+        """
+        CREATE TABLE IF NOT EXISTS patients (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            external_id VARCHAR(64) UNIQUE,
+            name VARCHAR(255),
+            sex ENUM('M','F','O'),
+            dob DATE
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lab_tests (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            code VARCHAR(32) UNIQUE,
+            name VARCHAR(255),
+            unit_default VARCHAR(32),
+            description TEXT
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            patient_id INT NOT NULL,
+            test_id INT NOT NULL,
+            value DOUBLE NOT NULL,
+            unit VARCHAR(32),
+            flag ENUM('High','Low','Normal') NULL,
+            result_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT fk_lab_patient FOREIGN KEY (patient_id) REFERENCES patients(id),
+            CONSTRAINT fk_lab_test FOREIGN KEY (test_id) REFERENCES lab_tests(id)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            patient_id VARCHAR(64),
+            report_date DATE,
+            abnormal_tests_count INT,
+            trends_json JSON,
+            escalation_json JSON,
+            knowledge_sources_json JSON,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (2, "report store: patients_new, reports, test_results", [
+        """
+        CREATE TABLE IF NOT EXISTS patients_new (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            external_id VARCHAR(64) NOT NULL UNIQUE,
+            name VARCHAR(255),
+            sex VARCHAR(8),
+            dob DATE
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            patient_id INT NOT NULL,
+            report_date DATE NOT NULL,
+            source VARCHAR(32),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_reports_patient_date (patient_id, report_date),
+            CONSTRAINT fk_reports_patient FOREIGN KEY (patient_id) REFERENCES patients_new(id)
+        ) ENGINE=InnoDB
+        """,
+        # create_or_get_report relies on ON DUPLICATE KEY, so older hand-made tables need it too
+        add_index(
+            "reports", "uq_reports_patient_date",
+            "ALTER TABLE reports ADD UNIQUE KEY uq_reports_patient_date (patient_id, report_date)",
+        ),
+        """
+        CREATE TABLE IF NOT EXISTS test_results (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            report_id INT NOT NULL,
+            code VARCHAR(32) NOT NULL,
+            name VARCHAR(255),
+            value DOUBLE NULL,
+            unit VARCHAR(32),
+            normal_range_low DOUBLE NULL,
+            normal_range_high DOUBLE NULL,
+            flag VARCHAR(16),
+            CONSTRAINT fk_results_report FOREIGN KEY (report_id) REFERENCES reports(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (3, "report_feedback and patient_profiles", [
+        """
+        CREATE TABLE IF NOT EXISTS report_feedback (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            report_id VARCHAR(255),
+            rating VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS patient_profiles (
+            patient_id VARCHAR(255) PRIMARY KEY,
+            medications TEXT,
+            medical_history TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (4, "backfill legacy patients/lab_results into patients_new/reports/test_results", [
+        """
+        INSERT INTO patients_new (external_id, name, sex, dob)
+        SELECT p.external_id, p.name, p.sex, p.dob
+        FROM patients p
+        WHERE p.external_id IS NOT NULL
+        ON DUPLICATE KEY UPDATE patients_new.id = patients_new.id
+        """,
+        # One report per (patient, result_date), like persist_report creates
+        """
+        INSERT INTO reports (patient_id, report_date, source)
+        SELECT DISTINCT pn.id, lr.result_date, 'legacy_backfill'
+        FROM lab_results lr
+        JOIN patients p ON p.id = lr.patient_id
+        JOIN patients_new pn ON pn.external_id = p.external_id
+        ON DUPLICATE KEY UPDATE reports.source = reports.source
+        """,
+        # The legacy path appended on every run, so keep only the newest row
+        # per (patient, test, date); codes already present in a report are left alone.
+        """
+        INSERT INTO test_results (report_id, code, name, value, unit, normal_range_low, normal_range_high, flag)
+        SELECT r.id, lt.code, lt.name, lr.value, lr.unit, NULL, NULL, lr.flag
+        FROM (
+            SELECT MAX(id) AS id FROM lab_results GROUP BY patient_id, test_id, result_date
+        ) latest
+        JOIN lab_results lr ON lr.id = latest.id
+        JOIN lab_tests lt ON lt.id = lr.test_id
+        JOIN patients p ON p.id = lr.patient_id
+        JOIN patients_new pn ON pn.external_id = p.external_id
+        JOIN reports r ON r.patient_id = pn.id AND r.report_date = lr.result_date
+        WHERE NOT EXISTS (
+            SELECT 1 FROM test_results tr WHERE tr.report_id = r.id AND tr.code = lt.code
+        )
+        """,
+    ]),
+    (5, "reports.content_hash for skipping unchanged re-persists", [
+        add_column(
+            "reports", "content_hash",
+            "ALTER TABLE reports ADD COLUMN content_hash CHAR(64) NULL",
+        ),
+    ]),
+    (6, "composite index for the history query: test_results(report_id, code)", [
+        # reports(patient_id, report_date) is already covered by uq_reports_patient_date
+        add_index(
+            "test_results", "idx_test_results_report_code",
+            "ALTER TABLE test_results ADD INDEX idx_test_results_report_code (report_id, code)",
+        ),
+    ]),
+    (7, "patient_latest_results: per (patient, code) last/previous value + rolling stats", [
+        """
+        CREATE TABLE IF NOT EXISTS patient_latest_results (
+            patient_id INT NOT NULL,
+            code VARCHAR(32) NOT NULL,
+            name VARCHAR(255),
+            last_value DOUBLE NULL,
+            last_unit VARCHAR(32),
+            last_date DATE NOT NULL,
+            prev_value DOUBLE NULL,
+            prev_unit VARCHAR(32),
+            prev_date DATE NULL,
+            normal_range_low DOUBLE NULL,
+            normal_range_high DOUBLE NULL,
+            n_values INT NOT NULL DEFAULT 0,
+            mean_value DOUBLE NULL,
+            min_value DOUBLE NULL,
+            max_value DOUBLE NULL,
+            recent_json JSON,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (patient_id, code),
+            CONSTRAINT fk_latest_patient FOREIGN KEY (patient_id) REFERENCES patients_new(id)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (8, "audit_logs: patient/created_at indexes, payload_zlib, monthly partitions", [
+        add_index(
+            "audit_logs", "idx_audit_logs_patient_created",
+            "ALTER TABLE audit_logs ADD INDEX idx_audit_logs_patient_created (patient_id, created_at)",
+        ),
+        add_index(
+            "audit_logs", "idx_audit_logs_created",
+            "ALTER TABLE audit_logs ADD INDEX idx_audit_logs_created (created_at)",
+        ),
+        add_column(
+            "audit_logs", "payload_zlib",
+            "ALTER TABLE audit_logs ADD COLUMN payload_zlib LONGBLOB NULL",
+        ),
+        # Last: rebuilds the table once with the new indexes (see src/audit_retention.py)
+        partition_audit_logs,
+    ]),
+]
+
+# Same schema for DB_BACKEND=sqlite: no ENUM/ENGINE, INTEGER PRIMARY KEY ids, TEXT for JSON,
+# CHECK instead of ENUM, and updated_at set by the upserts instead of ON UPDATE.
+SQLITE_STEPS: Dict[int, List[Step]] = {
+    1: [
+        """
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            external_id VARCHAR(64) UNIQUE,
+            name VARCHAR(255),
+            sex VARCHAR(1) CHECK (sex IN ('M','F','O')),
+            dob DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lab_tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code VARCHAR(32) UNIQUE,
+            name VARCHAR(255),
+            unit_default VARCHAR(32),
+            description TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL REFERENCES patients(id),
+            test_id INTEGER NOT NULL REFERENCES lab_tests(id),
+            value DOUBLE NOT NULL,
+            unit VARCHAR(32),
+            flag VARCHAR(8) NULL CHECK (flag IN ('High','Low','Normal')),
+            result_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id VARCHAR(64),
+            report_date DATE,
+            abnormal_tests_count INT,
+            trends_json TEXT,
+            escalation_json TEXT,
+            knowledge_sources_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    2: [
+        """
+        CREATE TABLE IF NOT EXISTS patients_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            external_id VARCHAR(64) NOT NULL UNIQUE,
+            name VARCHAR(255),
+            sex VARCHAR(8),
+            dob DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL REFERENCES patients_new(id),
+            report_date DATE NOT NULL,
+            source VARCHAR(32),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_reports_patient_date ON reports (patient_id, report_date)",
+        """
+        CREATE TABLE IF NOT EXISTS test_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+            code VARCHAR(32) NOT NULL,
+            name VARCHAR(255),
+            value DOUBLE NULL,
+            unit VARCHAR(32),
+            normal_range_low DOUBLE NULL,
+            normal_range_high DOUBLE NULL,
+            flag VARCHAR(16)
+        )
+        """,
+    ],
+    3: [
+        """
+        CREATE TABLE IF NOT EXISTS report_feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id VARCHAR(255),
+            rating VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS patient_profiles (
+            patient_id VARCHAR(255) PRIMARY KEY,
+            medications TEXT,
+            medical_history TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    4: [
+        """
+        INSERT OR IGNORE INTO patients_new (external_id, name, sex, dob)
+        SELECT p.external_id, p.name, p.sex, p.dob
+        FROM patients p
+        WHERE p.external_id IS NOT NULL
+        """,
+        """
+        INSERT OR IGNORE INTO reports (patient_id, report_date, source)
+        SELECT DISTINCT pn.id, lr.result_date, 'legacy_backfill'
+        FROM lab_results lr
+        JOIN patients p ON p.id = lr.patient_id
+        JOIN patients_new pn ON pn.external_id = p.external_id
+        """,
+        MIGRATIONS[3][2][2],  # the test_results backfill is portable SQL
+    ],
+    5: [
+        add_column("reports", "content_hash", "ALTER TABLE reports ADD COLUMN content_hash CHAR(64) NULL"),
+    ],
+    6: [
+        "CREATE INDEX IF NOT EXISTS idx_test_results_report_code ON test_results (report_id, code)",
+    ],
+    7: [
+        """
+        CREATE TABLE IF NOT EXISTS patient_latest_results (
+            patient_id INTEGER NOT NULL REFERENCES patients_new(id),
+            code VARCHAR(32) NOT NULL,
+            name VARCHAR(255),
+            last_value DOUBLE NULL,
+            last_unit VARCHAR(32),
+            last_date DATE NOT NULL,
+            prev_value DOUBLE NULL,
+            prev_unit VARCHAR(32),
+            prev_date DATE NULL,
+            normal_range_low DOUBLE NULL,
+            normal_range_high DOUBLE NULL,
+            n_values INT NOT NULL DEFAULT 0,
+            mean_value DOUBLE NULL,
+            min_value DOUBLE NULL,
+            max_value DOUBLE NULL,
+            recent_json TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (patient_id, code)
+        )
+        """,
+    ],
+    8: [
+        # No partitioning in SQLite; the retention job deletes expired months by range
+        "CREATE INDEX IF NOT EXISTS idx_audit_logs_patient_created ON audit_logs (patient_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_logs_created ON audit_logs (created_at)",
+        add_column("audit_logs", "payload_zlib", "ALTER TABLE audit_logs ADD COLUMN payload_zlib BLOB NULL"),
+    ],
+}
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_migrated = False
+_migrated_lock = threading.Lock()
+
+
+def _steps(version: int, steps: List[Step]) -> List[Step]:
+    """The steps of `version` for the configured DB_BACKEND."""
+    return SQLITE_STEPS[version] if get_storage().name == "sqlite" else steps
+
+
+def _ensure_version_table(cur) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """ + (" ENGINE=InnoDB" if get_storage().name == "mysql" else "")
+    )
+
+
+def applied_versions(cur) -> Dict[int, Any]:
+    cur.execute("SELECT version, applied_at FROM schema_version")
+    return {int(v): applied_at for v, applied_at in cur.fetchall()}
+
+
+def migrate(target: Optional[int] = None, verbose: bool = True) -> List[int]:
+    """
+    Applies pending migrations up to `target` (default: latest), in order.
+    On MySQL a named lock keeps several API workers starting at once from racing.
+    Returns the versions applied by this call.
+    """
+    target = LATEST_VERSION if target is None else target
+    applied_now: List[int] = []
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        with get_storage().migration_lock(cur):
+            _ensure_version_table(cur)
+            done = applied_versions(cur)
+            for version, description, steps in MIGRATIONS:
+                if version > target or version in done:
+                    continue
+                if verbose:
+                    print(f"Applying migration {version}: {description}")
+                # DDL auto-commits in MySQL, so each step must be safe to re-run
+                for step in _steps(version, steps):
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute(
+                    get_storage().insert_ignore_sql("schema_version", ("version", "description"), ("version",)),
+                    (version, description),
+                )
+                conn.commit()
+                applied_now.append(version)
+        cur.close()
+    finally:
+        conn.close()
+    return applied_now
+
+
+def migration_status() -> List[Dict[str, Any]]:
+    """[{version, description, applied_at or None}] for every known migration."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        _ensure_version_table(cur)
+        done = applied_versions(cur)
+        cur.close()
+    finally:
+        conn.close()
+    return [
+        {"version": v, "description": d, "applied_at": done.get(v)}
+        for v, d, _ in MIGRATIONS
+    ]
+
+
+def run_migrations_once() -> None:
+    """Startup hook: migrate at most once per process."""
+    global _migrated
+    with _migrated_lock:
+        if _migrated:
+            return
+        applied = migrate(verbose=False)
+        if applied:
+            print(f"✅ Applied schema migrations: {applied}")
+        _migrated = True
+
+
+# ---------- Query plan checks (python -m src.scripts.migrate explain) ----------
+
+def explain_history_query(external_id: str, limit_reports: int = 5) -> List[Dict[str, Any]]:
+    """EXPLAIN rows for trends_db's history query as the server would run it (EXPLAIN QUERY PLAN on SQLite)."""
+    from src.trends_db import HISTORY_SQL
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            return get_storage().explain(cur, HISTORY_SQL, (external_id, limit_reports))
+    finally:
+        conn.close()
+
+
+def check_history_plan(plan: List[Dict[str, Any]], limit_reports: Optional[int] = None) -> List[str]:
+    """
+    Problems in a history-query plan: any full scan (type=ALL) or index-less access
+    on a real table, and a derived table (<derivedN>) scanned with more rows than the
+    `limit_reports` it should have been cut to (all of a patient's reports materialised).
+    """
+    problems = []
+    for row in plan:
+        table = str(row.get("table") or "")
+        if not table:
+            continue
+        if table.startswith("<"):
+            rows = row.get("rows")
+            if limit_reports is not None and rows is not None and int(rows) > limit_reports:
+                problems.append(
+                    f"{table}: type={row.get('type')} rows={rows} > {limit_reports} (derived table not limited)"
+                )
+            continue
+        if row.get("type") == "ALL" or row.get("key") is None:
+            problems.append(
+                f"{table}: type={row.get('type')} key={row.get('key')} rows={row.get('rows')} (missing index?)"
+            )
+    return problems
+
+
+def time_history_query(external_id: str, limit_reports: int = 5, repeats: int = 20) -> Dict[str, float]:
+    """Median / max wall time (ms) of fetch_last_results_for_patient for one patient."""
+    import statistics
+    import time
+    from src.trends_db import fetch_last_results_for_patient
+
+    timings = []
+    rows = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = fetch_last_results_for_patient(external_id, limit_reports)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {"rows": len(rows), "median_ms": round(statistics.median(timings), 2), "max_ms": round(max(timings), 2)}
+
+
+def busiest_patient() -> Optional[str]:
+    """external_id with the most reports, a realistic worst case for the plan check."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT p.external_id FROM reports r JOIN patients_new p ON p.id = r.patient_id
+                GROUP BY p.external_id ORDER BY COUNT(*) DESC LIMIT 1
+                """
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+    finally:
+        conn.close()
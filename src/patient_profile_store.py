@@ -1,25 +1,26 @@
 
 from typing import Dict, Any, Optional
 from src.db import get_connection
+from src.storage import get_storage
 
 def create_profile_table_if_not_exists():
     """
     Creates the patient_profiles table if it does not exist.
+    (Now just makes sure the schema migrations have run; see src/migrations.py.)
     """
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS patient_profiles (
-                patient_id VARCHAR(255) PRIMARY KEY,
-                medications TEXT,
-                medical_history TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            );
-            """)
-        conn.commit()
-    finally:
-        conn.close()
+    from src.migrations import run_migrations_once
+    run_migrations_once()
+
+PROFILE_SELECT_SQL = "SELECT medications, medical_history FROM patient_profiles WHERE patient_id = %s"
+
+
+def profile_from_row(row: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    if row:
+        return {
+            "medications": row["medications"] or "",
+            "medical_history": row["medical_history"] or ""
+        }
+    return {"medications": "", "medical_history": ""}
 
 def get_profile(patient_id: str) -> Dict[str, str]:
     """
@@ -29,20 +30,10 @@ def get_profile(patient_id: str) -> Dict[str, str]:
     conn = get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(
-                "SELECT medications, medical_history FROM patient_profiles WHERE patient_id = %s",
-                (patient_id,)
-            )
-            row = cur.fetchone()
-            if row:
-                return {
-                    "medications": row["medications"] or "",
-                    "medical_history": row["medical_history"] or ""
-                }
+            cur.execute(PROFILE_SELECT_SQL, (patient_id,))
+            return profile_from_row(cur.fetchone())
     finally:
         conn.close()
-    
-    return {"medications": "", "medical_history": ""}
 
 def save_profile(patient_id: str, medications: str, medical_history: str):
     """
@@ -52,13 +43,13 @@ def save_profile(patient_id: str, medications: str, medical_history: str):
     try:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO patient_profiles (patient_id, medications, medical_history)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    medications = VALUES(medications),
-                    medical_history = VALUES(medical_history)
-                """,
+                get_storage().upsert_sql(
+                    "patient_profiles",
+                    ("patient_id", "medications", "medical_history"),
+                    ("patient_id",),
+                    ("medications", "medical_history"),
+                    ["updated_at = CURRENT_TIMESTAMP"],
+                ),
                 (patient_id, medications, medical_history)
             )
         conn.commit()
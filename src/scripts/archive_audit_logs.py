@@ -0,0 +1,34 @@
+# src/scripts/archive_audit_logs.py
+"""
+Audit log retention: export months older than AUDIT_RETENTION_MONTHS to gzipped JSONL
+(AUDIT_ARCHIVE_DIR) and drop them from audit_logs; on MySQL also pre-create the
+upcoming monthly partitions. Meant for a daily/monthly cron.
+
+    python -m src.scripts.archive_audit_logs
+    python -m src.scripts.archive_audit_logs --retention-months 6 --dry-run
+"""
+import argparse
+
+from src.config import AUDIT_ARCHIVE_DIR, AUDIT_PARTITION_MONTHS_AHEAD, AUDIT_RETENTION_MONTHS
+from src.audit_retention import archive_audit_logs, ensure_future_partitions
+from src.migrations import run_migrations_once
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive and expire old audit_logs rows")
+    parser.add_argument("--retention-months", type=int, default=AUDIT_RETENTION_MONTHS, help="months to keep (0 = forever)")
+    parser.add_argument("--archive-dir", default=AUDIT_ARCHIVE_DIR)
+    parser.add_argument("--months-ahead", type=int, default=AUDIT_PARTITION_MONTHS_AHEAD, help="MySQL partitions to create ahead")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    args = parser.parse_args()
+
+    run_migrations_once()
+    if not args.dry_run:
+        added = ensure_future_partitions(args.months_ahead)
+        if added:
+            print(f"Added partitions: {', '.join(added)}")
+
+    results = archive_audit_logs(args.retention_months, args.archive_dir, dry_run=args.dry_run)
+    for month, n_rows, path in results:
+        print(f"{month}: {n_rows} rows" + (f" -> {path}" if path else " (dry run)" if args.dry_run else ""))
+    print(f"✅ {'Would archive' if args.dry_run else 'Archived'} {len(results)} month(s)")
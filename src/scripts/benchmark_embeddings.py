@@ -0,0 +1,101 @@
+import os
+import csv
+import glob
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from src.config import EMBED_MODEL_NAME
+from src.embedding_backends import OnnxSentenceEncoder, load_embedding_model
+from src.knowledge_bundles import BUNDLE_TESTS, DIRECTIONS, bundle_query
+
+CORPUS_DIR = "data/medical_corpus"
+OUTPUT_FILE = "experiments/embedding_benchmark.csv"
+K = 4
+REPEATS = 3
+
+
+def load_corpus_chunks() -> List[str]:
+    # same paragraph chunking as ingest_corpus
+    chunks = []
+    for fpath in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.md"))):
+        with open(fpath, "r", encoding="utf-8") as f:
+            text = f.read()
+        chunks.extend(c.strip() for c in text.split("\n\n") if len(c.strip()) > 50)
+    return chunks
+
+
+def time_encode(model, texts: List[str]) -> float:
+    """Best-of-N wall time for encoding `texts` once (first call warms up)."""
+    model.encode(texts[:8])
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=32)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def top_k(query_vecs: np.ndarray, doc_vecs: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vecs @ doc_vecs.T  # vectors are L2-normalised
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    docs = load_corpus_chunks()
+    queries = [bundle_query(name, d) for name in BUNDLE_TESTS.values() for d in DIRECTIONS]
+    print(f"Benchmarking on {len(docs)} chunks, {len(queries)} queries, k={K}")
+
+    backends: Dict[str, object] = {"torch": load_embedding_model(EMBED_MODEL_NAME, "torch")}
+    for label, quantized in (("onnx-fp32", False), ("onnx-int8", True)):
+        try:
+            backends[label] = OnnxSentenceEncoder(quantized=quantized, model_name=EMBED_MODEL_NAME)
+        except (FileNotFoundError, ImportError, ValueError) as e:
+            print(f"Skipping {label}: {e}")
+
+    # PyTorch vectors are the reference (that's what is in Chroma today)
+    ref_docs = np.asarray(backends["torch"].encode(docs), dtype=np.float32)
+    ref_queries = np.asarray(backends["torch"].encode(queries), dtype=np.float32)
+    ref_top = top_k(ref_queries, ref_docs, K)
+
+    rows = []
+    for label, model in backends.items():
+        secs = time_encode(model, docs)
+        doc_vecs = np.asarray(model.encode(docs), dtype=np.float32)
+        q_vecs = np.asarray(model.encode(queries), dtype=np.float32)
+
+        # recall@k of this backend's own index vs the PyTorch top-k
+        own_top = top_k(q_vecs, doc_vecs, K)
+        recall_own = np.mean([len(set(a) & set(b)) / K for a, b in zip(own_top, ref_top)])
+
+        # Chroma compatibility: this backend's queries against the existing (PyTorch) doc vectors
+        mixed_top = top_k(q_vecs, ref_docs, K)
+        recall_mixed = np.mean([len(set(a) & set(b)) / K for a, b in zip(mixed_top, ref_top)])
+
+        cos = float(np.mean(np.sum(doc_vecs * ref_docs, axis=1)))
+
+        rows.append({
+            "backend": label,
+            "docs_per_sec": round(len(docs) / secs, 1),
+            "encode_secs": round(secs, 4),
+            f"recall@{K}": round(float(recall_own), 4),
+            f"recall@{K}_vs_chroma": round(float(recall_mixed), 4),
+            "mean_cosine_vs_torch": round(cos, 5),
+        })
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    with open(OUTPUT_FILE, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n" + "=" * 40)
+    for r in rows:
+        print(r)
+    print("=" * 40)
+    print(f"✅ Results saved to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
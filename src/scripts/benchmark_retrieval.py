@@ -0,0 +1,258 @@
+"""
+Retrieval benchmark for the local RAG path: speed and quality per configuration.
+
+Grid: chunking (paragraph / sliding window, size, overlap) x embedding backend
+x vector store x retriever (vector-only / vector+BM25 fusion) x k.
+
+Labeled queries are the same value-free queries the pipeline sends
+(knowledge_bundles.local_query) for every bundled test code and direction;
+a hit is a chunk from one of the corpus files listed for that code in RELEVANT_FILES.
+
+    python -m src.scripts.benchmark_retrieval
+    python -m src.scripts.benchmark_retrieval --backends torch,onnx --stores numpy,faiss --k 2,4
+
+Writes experiments/retrieval_benchmark.json and .csv (one row per configuration).
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import EMBED_MODEL_NAME
+from src.embedding_backends import load_embedding_model
+from src.knowledge_bundles import BUNDLE_TESTS, DIRECTIONS, local_query
+from src.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.vector_store import build_vector_store, get_vector_store, ChromaVectorStore
+from src.chunking import CORPUS_DIR, chunk_document, chunk_text, chunk_ids, list_corpus_files, sha256_hex
+
+OUTPUT_JSON = "experiments/retrieval_benchmark.json"
+OUTPUT_CSV = "experiments/retrieval_benchmark.csv"
+
+# Corpus files that answer questions about each test code
+_CBC = ["cbc_basics.md"]
+_ANEMIA = ["hemoglobin_anemia_basics.md", "common_symptoms_anemia.md", "cbc_basics.md"]
+_IRON = ["iron_studies_basics.md", "hemoglobin_anemia_basics.md"]
+_THYROID = ["tsh_hypothyroidism_basics.md", "thyroid_tests_free_t4_t3.md", "common_symptoms_hypothyroid.md"]
+RELEVANT_FILES = {
+    "HGB": _ANEMIA, "HCT": _ANEMIA, "RBC": _ANEMIA,
+    "MCV": _ANEMIA, "MCH": _ANEMIA, "MCHC": _ANEMIA,
+    "WBC": _CBC, "PLT": _CBC,
+    "FERRITIN": _IRON, "IRON": _IRON, "TIBC": _IRON, "TSAT": _IRON,
+    "TSH": _THYROID, "FT4": _THYROID, "FT3": _THYROID, "T4": _THYROID, "T3": _THYROID,
+}
+
+# (strategy, chunk_size, overlap); "paragraph" is what ingest_corpus ships with
+CHUNKINGS = [
+    ("paragraph", 1200, 150),
+    ("window", 400, 50),
+    ("window", 800, 100),
+    ("window", 1200, 150),
+]
+
+
+def labeled_queries() -> List[Tuple[str, set]]:
+    return [
+        (local_query(name, d), set(RELEVANT_FILES.get(code, [])))
+        for code, name in BUNDLE_TESTS.items()
+        for d in DIRECTIONS
+        if RELEVANT_FILES.get(code)
+    ]
+
+
+def load_chunks(strategy: str, size: int, overlap: int) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    ids, docs, metas = [], [], []
+    for fpath in list_corpus_files(CORPUS_DIR):
+        fname = os.path.basename(fpath)
+        with open(fpath, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        chunks = chunk_document(text, size, overlap) if strategy == "paragraph" else chunk_text(text, size, overlap)
+        ids.extend(chunk_ids(fname, [sha256_hex(c.encode("utf-8")) for c in chunks]))
+        for i, c in enumerate(chunks):
+            docs.append(c)
+            metas.append({"source": fname, "chunk": i})
+    return ids, docs, metas
+
+
+def _rss_mb() -> Optional[float]:
+    """Current (not peak) resident set size; None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+
+
+def _dir_mb(path: str) -> float:
+    total = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return round(total / (1024.0 * 1024.0), 2)
+
+
+def build_index(store: str, ids, docs, metas, vectors: np.ndarray, work_dir: str):
+    """Ephemeral Chroma collection (+ numpy/faiss export) and a BM25 index over the same chunks."""
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    name = f"bench_{os.path.basename(work_dir)}"
+    col = client.create_collection(name)
+    for start in range(0, len(ids), 512):
+        end = start + 512
+        col.add(ids=ids[start:end], documents=docs[start:end], metadatas=metas[start:end],
+                embeddings=vectors[start:end].tolist())
+
+    if store == "chroma":
+        vstore = ChromaVectorStore(col)
+        index_mb = round(vectors.nbytes / (1024.0 * 1024.0), 2)
+    else:
+        store_dir = os.path.join(work_dir, store)
+        build_vector_store(col, store, store_dir)
+        vstore = get_vector_store(col, store, store_dir)
+        index_mb = _dir_mb(store_dir)
+
+    bm25 = BM25Index()
+    for doc_id, text, meta in zip(ids, docs, metas):
+        bm25.add(doc_id, text, meta)
+    return client, name, vstore, bm25, index_mb
+
+
+def retrieve(model, vstore, bm25: BM25Index, retriever: str, query: str, k: int, metas_by_id) -> List[str]:
+    """Mirrors local_medical_knowledge_with_sources; returns the source file of each top-k chunk."""
+    q_emb = np.asarray(model.encode([query]), dtype=np.float32)[0].tolist()
+    vector_ranking = [doc_id for doc_id, _, _ in vstore.query(q_emb, k * 3)]
+    if retriever == "hybrid":
+        bm25_ranking = [bm25.ids[i] for i, _ in bm25.search(query, k=k * 3)]
+        ranked = [doc_id for doc_id, _ in reciprocal_rank_fusion([vector_ranking, bm25_ranking])]
+    else:
+        ranked = vector_ranking
+    return [metas_by_id[doc_id]["source"] for doc_id in ranked[:k]]
+
+
+def score(results: List[List[str]], labels: List[set]) -> Tuple[float, float]:
+    """recall@k = share of relevant files covered in the top k; MRR over the first relevant chunk."""
+    recalls, rr = [], []
+    for got, relevant in zip(results, labels):
+        recalls.append(len(set(got) & relevant) / len(relevant))
+        rank = next((i + 1 for i, src in enumerate(got) if src in relevant), None)
+        rr.append(1.0 / rank if rank else 0.0)
+    return float(np.mean(recalls)), float(np.mean(rr))
+
+
+def run(backends: List[str], stores: List[str], retrievers: List[str], ks: List[int], repeats: int) -> List[Dict[str, Any]]:
+    queries = labeled_queries()
+    texts = [q for q, _ in queries]
+    labels = [rel for _, rel in queries]
+    print(f"{len(queries)} labeled queries over {len(list_corpus_files(CORPUS_DIR))} corpus files")
+
+    rows = []
+    work_root = tempfile.mkdtemp(prefix="retrieval_bench_")
+    try:
+        for backend in backends:
+            try:
+                model = load_embedding_model(EMBED_MODEL_NAME, backend)  # uncached: measure real encode cost
+            except (FileNotFoundError, ImportError, ValueError) as e:
+                print(f"Skipping backend {backend}: {e}")
+                continue
+            model.encode(texts[:2])  # warm-up
+
+            for strategy, size, overlap in CHUNKINGS:
+                ids, docs, metas = load_chunks(strategy, size, overlap)
+                metas_by_id = dict(zip(ids, metas))
+
+                for store in stores:
+                    work_dir = os.path.join(work_root, f"{backend}_{strategy}_{size}_{overlap}_{store}")
+                    os.makedirs(work_dir, exist_ok=True)
+                    gc.collect()
+                    rss_before = _rss_mb()
+                    t0 = time.perf_counter()
+                    vectors = np.asarray(model.encode(docs, batch_size=32), dtype=np.float32)
+                    try:
+                        client, col_name, vstore, bm25, index_mb = build_index(store, ids, docs, metas, vectors, work_dir)
+                    except ImportError as e:
+                        print(f"Skipping store {store}: {e}")
+                        continue
+                    build_s = time.perf_counter() - t0
+                    # RSS growth while embedding + indexing this configuration's chunks
+                    # (ru_maxrss is the process-wide high-water mark, same for every later row)
+                    rss_after = _rss_mb()
+                    index_rss_mb = round(rss_after - rss_before, 1) if rss_before is not None else None
+
+                    for retriever in retrievers:
+                        for k in ks:
+                            results = [retrieve(model, vstore, bm25, retriever, q, k, metas_by_id) for q in texts]
+                            recall, mrr = score(results, labels)
+
+                            latencies = []
+                            for _ in range(repeats):
+                                for q in texts:
+                                    start = time.perf_counter()
+                                    retrieve(model, vstore, bm25, retriever, q, k, metas_by_id)
+                                    latencies.append((time.perf_counter() - start) * 1000.0)
+
+                            row = {
+                                "backend": backend,
+                                "chunking": strategy,
+                                "chunk_size": size,
+                                "overlap": overlap,
+                                "n_chunks": len(ids),
+                                "store": store,
+                                "retriever": retriever,
+                                "k": k,
+                                "build_s": round(build_s, 3),
+                                "index_mb": index_mb,
+                                "index_rss_mb": index_rss_mb,
+                                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                                "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                                "qps": round(len(latencies) / (sum(latencies) / 1000.0), 1),
+                                "recall_at_k": round(recall, 3),
+                                "mrr": round(mrr, 3),
+                            }
+                            rows.append(row)
+                            print(row)
+
+                    client.delete_collection(col_name)
+                    del client, vstore, bm25, vectors  # so the next configuration's RSS baseline excludes them
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local retrieval configurations")
+    parser.add_argument("--backends", default="torch", help="comma-separated: torch,onnx")
+    parser.add_argument("--stores", default="chroma,numpy", help="comma-separated: chroma,numpy,faiss")
+    parser.add_argument("--retrievers", default="vector,hybrid", help="comma-separated: vector,hybrid")
+    parser.add_argument("--k", default="2,4", help="comma-separated k values")
+    parser.add_argument("--repeats", type=int, default=3, help="timed passes over the query set")
+    args = parser.parse_args()
+
+    split = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    rows = run(
+        backends=split(args.backends),
+        stores=split(args.stores),
+        retrievers=split(args.retrievers),
+        ks=[int(x) for x in split(args.k)],
+        repeats=args.repeats,
+    )
+    if not rows:
+        print("No configurations ran.")
+        return
+
+    os.makedirs(os.path.dirname(OUTPUT_JSON), exist_ok=True)
+    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
+        json.dump({"model": EMBED_MODEL_NAME, "queries": len(labeled_queries()), "results": rows}, f, indent=2)
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✅ Wrote {len(rows)} configurations to {OUTPUT_JSON} and {OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
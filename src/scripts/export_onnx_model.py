@@ -0,0 +1,65 @@
+import os
+import json
+import argparse
+
+from src.config import EMBED_MODEL_NAME, EMBED_ONNX_DIR
+from src.embedding_backends import ONNX_FP32_FILE, ONNX_INT8_FILE, ONNX_INFO_FILE
+
+
+def export(model_name: str = EMBED_MODEL_NAME, out_dir: str = EMBED_ONNX_DIR, quantize: bool = True):
+    """
+    Exports the transformer part of the SentenceTransformer model to ONNX
+    (pooling + normalisation are done in numpy by OnnxSentenceEncoder),
+    then writes a dynamically int8-quantized copy next to it.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    hf_model = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(out_dir)  # writes tokenizer.json
+
+    sample = tokenizer(["hemoglobin low clinical guidelines"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, ONNX_FP32_FILE)
+
+    print(f"Exporting {model_name} -> {fp32_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "token_type_ids": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(out_dir, ONNX_INT8_FILE)
+        print(f"Quantizing -> {int8_path}")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    # lets OnnxSentenceEncoder refuse to serve this export under a different model name
+    with open(os.path.join(out_dir, ONNX_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_seq_length": st_model.max_seq_length}, f)
+
+    print(f"✅ ONNX model written to {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX for EMBED_BACKEND=onnx")
+    parser.add_argument("--model", default=EMBED_MODEL_NAME)
+    parser.add_argument("--out-dir", default=EMBED_ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+    export(args.model, args.out_dir, quantize=not args.no_quantize)
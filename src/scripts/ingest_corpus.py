@@ -1,56 +1,286 @@
 import os
-import glob
-from typing import List
-from src.local_knowledge_tool import _col, _model  # Re-use the collection from your tool
+import json
+import argparse
+import multiprocessing
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from src.vector_store import build_vector_store, vector_store_exists
+from src.config import VECTOR_STORE
+from src.knowledge_bundles import build_bundles, save_bundles, BUNDLES_PATH
+from src.bm25_index import BM25Index, BM25_PATH, set_bm25_index
+from src.chunking import (  # noqa: F401 - re-exported: build_knowledge_index / benchmarks used to import them from here
+    CORPUS_DIR,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNKER_VERSION,
+    chunk_text,
+    chunk_document,
+    chunk_id,
+    chunk_ids,
+    list_corpus_files,
+    read_and_chunk,
+)
 
-CORPUS_DIR = "data/medical_corpus"
+# Same directory as local_knowledge_tool.PERSIST_DIR; not imported from there because that
+# module loads the embedding model and opens Chroma, which this module must not do at import
+# time (spawned chunking workers re-import it).
+MANIFEST_PATH = os.path.join("data/chroma_db", "ingest_manifest.json")
 
-def ingest_all_markdowns():
+BATCH_SIZE = 64  # chunks per encode/upsert call
+
+
+def _knowledge_tool():
+    """The Chroma collection / encoder live in local_knowledge_tool; loaded on first use."""
+    import src.local_knowledge_tool as lkt
+    return lkt
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"chunker": CHUNKER_VERSION, "files": {}}
+    if manifest.get("chunker") != CHUNKER_VERSION:
+        # keep chunk hashes (unchanged chunks still won't be re-embedded), drop file hashes
+        for entry in manifest.get("files", {}).values():
+            entry["sha256"] = None
+        manifest["chunker"] = CHUNKER_VERSION
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_chunked_files(files: List[str], manifest: Dict[str, Any], workers: int = 1) -> Iterator[Tuple[str, str, Optional[List[Tuple[str, str]]]]]:
+    """
+    Stage 1 (read -> chunk). With workers > 1 files are chunked in a process pool,
+    a bounded window at a time so chunked text never piles up ahead of the
+    (much slower) embedding stage. Workers are spawned, not forked: they only
+    import src.chunking and never share the parent's Chroma/SQLite handles.
     """
-    Reads all .md files in data/medical_corpus, chunks them, and upserts to ChromaDB.
-    """
-    files = glob.glob(os.path.join(CORPUS_DIR, "*.md"))
-    print(f"Found {len(files)} markdown files in {CORPUS_DIR}")
-    
-    all_ids = []
-    all_docs = []
-    all_metas = []
-    
-    for fpath in files:
-        fname = os.path.basename(fpath)
-        print(f"Processing {fname}...")
-        
-        with open(fpath, "r", encoding="utf-8") as f:
-            text = f.read()
-            
-        # Simple chunking by paragraph or fixed size
-        # Ideally split by headers, but for now paragraphs is fine
-        chunks = [c.strip() for c in text.split("\n\n") if len(c.strip()) > 50]
-        
-        for i, chunk in enumerate(chunks):
-            # Create a unique ID
-            chunk_id = f"{fname}_chunk_{i}"
-            
-            all_ids.append(chunk_id)
-            all_docs.append(chunk)
-            all_metas.append({"source": fname, "chunk": i})
-
-    if not all_ids:
-        print("No content to ingest.")
+    known = manifest["files"]
+    jobs = ((fp, (known.get(os.path.basename(fp)) or {}).get("sha256")) for fp in files)
+    if workers <= 1:
+        yield from map(read_and_chunk, jobs)
         return
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        for window in batched(jobs, workers * 4):
+            yield from pool.imap(read_and_chunk, window)
+
+
+def iter_changed_chunks(chunked_files, manifest: Dict[str, Any], pending: Dict[str, Dict[str, Any]], stats: Dict[str, int]) -> Iterator[Tuple[str, str, Optional[str], int, Dict[str, Any]]]:
+    """
+    Stage 2 (diff against the manifest). Yields (fname, id, text, position, meta) for new
+    chunks, and (fname, id, None, position, meta) for known chunks that only moved within
+    the file (metadata update, no embedding). Ids are content-keyed (chunk_id), so the
+    manifest maps id -> position.
+
+    A changed file is marked in-progress in the manifest (sha256=None) holding only the
+    chunks that are already committed; its sha256 is written by _complete_files
+    once every changed chunk has been upserted.
+    """
+    known = manifest["files"]
+    for fname, file_hash, chunks in chunked_files:
+        if chunks is None:
+            stats["files_unchanged"] += 1
+            continue
+
+        stats["files_changed"] += 1
+        old_chunks = (known.get(fname) or {}).get("chunks", {})
+        ids = chunk_ids(fname, [h for _, h in chunks])
+        known[fname] = {
+            "sha256": None,
+            "chunks": {cid: old_chunks[cid] for cid in ids if cid in old_chunks},
+        }
+        state = pending[fname] = {"file_hash": file_hash, "outstanding": 0, "yielding": True}
+
+        for i, ((chunk, _), cid) in enumerate(zip(chunks, ids)):
+            if cid in old_chunks:
+                if old_chunks[cid] == i:
+                    continue
+                chunk = None  # same text, new position: only the "chunk" metadata changes
+            state["outstanding"] += 1
+            yield fname, cid, chunk, i, {"source": fname, "chunk": i}
+
+        state["yielding"] = False
+
+
+def _complete_files(manifest: Dict[str, Any], pending: Dict[str, Dict[str, Any]]) -> None:
+    for fname, state in list(pending.items()):
+        if not state["yielding"] and state["outstanding"] == 0:
+            manifest["files"][fname]["sha256"] = state["file_hash"]
+            del pending[fname]
+
+
+def _upsert_batch(batch: List[Tuple[str, str, Optional[str], int, Dict[str, Any]]]) -> Tuple[int, int]:
+    """Stage 3 + 4: embed + upsert the new chunks of one batch, re-tag the moved ones. Returns (new, moved)."""
+    new = [rec for rec in batch if rec[2] is not None]
+    moved = [rec for rec in batch if rec[2] is None]
+    lkt = _knowledge_tool()
+    if new:
+        docs = [rec[2] for rec in new]
+        embeddings = lkt._model.encode(docs, batch_size=BATCH_SIZE).tolist()
+        lkt._col.upsert(ids=[rec[1] for rec in new], documents=docs, embeddings=embeddings,
+                        metadatas=[rec[4] for rec in new])
+    if moved:
+        lkt._col.update(ids=[rec[1] for rec in moved], metadatas=[rec[4] for rec in moved])
+    return len(new), len(moved)
+
+
+def _collection_ids(page_size: int = 1000) -> Iterator[str]:
+    col = _knowledge_tool()._col
+    offset = 0
+    while True:
+        page = col.get(include=[], limit=page_size, offset=offset)
+        ids = page.get("ids", [])
+        if not ids:
+            return
+        yield from ids
+        offset += len(ids)
+
+
+def ingest_incremental(corpus_dir: str = CORPUS_DIR, force: bool = False, workers: int = 1) -> Dict[str, int]:
+    """
+    Single incremental ingester for data/medical_corpus (.md and .txt), as a
+    generator pipeline: read -> chunk -> embed (fixed-size batches) -> upsert.
 
-    print(f"Encoding {len(all_docs)} chunks...")
-    embeddings = _model.encode(all_docs).tolist()
+      - per-file sha256 hashes and each file's chunk ids (keyed on chunk content) live in MANIFEST_PATH
+      - unchanged files are skipped without being chunked; only chunks with new text are
+        embedded (an edit near the top of a file doesn't re-embed everything below it)
+      - memory is bounded by one batch (+ one window of chunked files when workers > 1)
+      - the manifest (with every committed chunk) is checkpointed after
+        each upserted batch, so a failed run re-embeds only what wasn't committed yet
+      - ids that no longer exist in the corpus (including legacy '::chunk' ids) are deleted
+    BM25 index and knowledge bundles are rebuilt only if something changed.
+    """
+    files = list_corpus_files(corpus_dir)
+    print(f"Found {len(files)} corpus files in {corpus_dir}")
+
+    manifest = {"chunker": CHUNKER_VERSION, "files": {}} if force else load_manifest()
+    manifest.pop("cursor", None)  # written by older versions, never used for resuming
+
+    stats: Dict[str, int] = {"files_changed": 0, "files_unchanged": 0, "chunks_upserted": 0, "chunks_moved": 0}
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    # files removed from disk -> their chunks get swept below
+    present = {os.path.basename(fp) for fp in files}
+    for fname in [f for f in manifest["files"] if f not in present]:
+        del manifest["files"][fname]
+
+    changed_chunks = iter_changed_chunks(iter_chunked_files(files, manifest, workers), manifest, pending, stats)
+    for batch in batched(changed_chunks, BATCH_SIZE):
+        n_new, n_moved = _upsert_batch(batch)
+
+        for fname, cid, _, position, _ in batch:
+            manifest["files"][fname]["chunks"][cid] = position
+            pending[fname]["outstanding"] -= 1
+        stats["chunks_upserted"] += n_new
+        stats["chunks_moved"] += n_moved
+        _complete_files(manifest, pending)
+        save_manifest(manifest)
+        print(f"  upserted {stats['chunks_upserted']} chunks (last: {batch[-1][1]})")
+
+    _complete_files(manifest, pending)
+
+    # anything in the collection the manifest doesn't know about is stale
+    live_ids = {cid for entry in manifest["files"].values() for cid in entry["chunks"]}
+    stale_ids = [cid for cid in _collection_ids() if cid not in live_ids]
+    for batch in batched(stale_ids, BATCH_SIZE):
+        _knowledge_tool()._col.delete(ids=batch)
 
-    print(f"Upserting to ChromaDB collection '{_col.name}'...")
-    _col.upsert(
-        ids=all_ids,
-        documents=all_docs,
-        embeddings=embeddings,
-        metadatas=all_metas
+    save_manifest(manifest)
+
+    changed = stats["chunks_upserted"] > 0 or stats["chunks_moved"] > 0 or bool(stale_ids)
+    print(
+        f"✅ Ingestion Complete! files changed={stats['files_changed']} "
+        f"unchanged={stats['files_unchanged']} chunks embedded={stats['chunks_upserted']} "
+        f"moved={stats['chunks_moved']} stale deleted={len(stale_ids)}"
     )
-    
-    print("✅ Ingestion Complete!")
+
+    if changed or force or not vector_store_exists(VECTOR_STORE):
+        build_local_vector_store(VECTOR_STORE)
+    if changed or force or not os.path.exists(BM25_PATH):
+        build_bm25_index()
+    if changed or force or not os.path.exists(BUNDLES_PATH):
+        build_knowledge_bundles()
+
+    return {**stats, "stale_deleted": len(stale_ids)}
+
+
+def ingest_all_markdowns():
+    """
+    Kept for existing callers; ingestion is incremental now.
+    """
+    return ingest_incremental()
+
+
+def build_local_vector_store(backend: str = VECTOR_STORE):
+    """
+    Export the Chroma collection into the numpy / faiss store used for local retrieval
+    (no-op for chroma).
+    """
+    if backend == "chroma":
+        return
+    lkt = _knowledge_tool()
+    n = build_vector_store(lkt._col, backend)
+    lkt.reload_vector_store()
+    print(f"✅ {backend} vector store: {n} vectors")
+
+
+def build_bm25_index(page_size: int = 1000):
+    """
+    Keyword index over exactly the chunks stored in Chroma (same ids),
+    fused with vector hits in local_medical_knowledge_with_sources.
+    """
+    col = _knowledge_tool()._col
+    index = BM25Index()
+    offset = 0
+    while True:
+        page = col.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        page_ids = page.get("ids", [])
+        if not page_ids:
+            break
+        for doc_id, doc, meta in zip(page_ids, page.get("documents", []), page.get("metadatas", [])):
+            index.add(doc_id, doc or "", meta or {})
+        offset += len(page_ids)
+    index.save(BM25_PATH)
+    set_bm25_index(index)
+    print(f"✅ BM25 index: {len(index)} chunks, {len(index.postings)} terms -> {BM25_PATH}")
+
+
+def build_knowledge_bundles(k: int = 2):
+    """
+    Precompute top-k chunks + citation metadata for every known test code/direction,
+    so the graph can answer common tests without any embedding work.
+    """
+    print("Precomputing knowledge bundles for known test codes...")
+    bundles = build_bundles(_knowledge_tool().local_medical_knowledge_with_sources, k=k)
+    save_bundles(bundles, BUNDLES_PATH)
+    print(f"✅ Wrote {len(bundles)} bundles to {BUNDLES_PATH}")
 
 if __name__ == "__main__":
-    ingest_all_markdowns()
+    parser = argparse.ArgumentParser(description="Incrementally ingest data/medical_corpus into ChromaDB")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and re-embed everything")
+    parser.add_argument("--workers", type=int, default=1, help="processes used for reading/chunking files")
+    parser.add_argument("--vector-store", choices=["numpy", "faiss"], action="append",
+                        help="also (re)build this export regardless of VECTOR_STORE; repeatable")
+    args = parser.parse_args()
+    ingest_incremental(force=args.force, workers=args.workers)
+    for backend in args.vector_store or []:
+        build_local_vector_store(backend)
@@ -0,0 +1,51 @@
+# src/scripts/migrate.py
+"""
+Schema migrations (see src/migrations.py).
+
+    python -m src.scripts.migrate            # apply pending migrations
+    python -m src.scripts.migrate status     # list migrations and when they were applied
+    python -m src.scripts.migrate migrate --target 2
+    python -m src.scripts.migrate explain [--patient P001]   # EXPLAIN + timing of the history query
+"""
+import argparse
+import sys
+
+from src.migrations import (
+    migrate,
+    migration_status,
+    LATEST_VERSION,
+    explain_history_query,
+    check_history_plan,
+    time_history_query,
+    busiest_patient,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or inspect database schema migrations")
+    parser.add_argument("command", nargs="?", default="migrate", choices=["migrate", "status", "explain"])
+    parser.add_argument("--target", type=int, default=None, help=f"stop at this version (default: {LATEST_VERSION})")
+    parser.add_argument("--patient", default=None, help="external_id for 'explain' (default: patient with most reports)")
+    parser.add_argument("--limit-reports", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "explain":
+        patient = args.patient or busiest_patient() or "__none__"
+        plan = explain_history_query(patient, args.limit_reports)
+        for row in plan:
+            print({k: row.get(k) for k in ("id", "select_type", "table", "type", "key", "rows", "Extra")})
+        timing = time_history_query(patient, args.limit_reports)
+        print(f"history query for {patient}: {timing}")
+        problems = check_history_plan(plan, args.limit_reports)
+        for p in problems:
+            print(f"❌ {p}")
+        if problems:
+            sys.exit(1)
+        print("✅ History query plan uses indexes")
+    elif args.command == "status":
+        for m in migration_status():
+            state = f"applied {m['applied_at']}" if m["applied_at"] else "pending"
+            print(f"{m['version']:>4}  {state:<32} {m['description']}")
+    else:
+        applied = migrate(target=args.target)
+        print(f"✅ Applied {applied}" if applied else "✅ Schema is up to date")
@@ -0,0 +1,19 @@
+# src/scripts/rebuild_latest_results.py
+"""
+Backfill / repair patient_latest_results from test_results.
+
+    python -m src.scripts.rebuild_latest_results              # every patient
+    python -m src.scripts.rebuild_latest_results --patient P001
+"""
+import argparse
+
+from src.graph.report_store import rebuild_latest_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the patient_latest_results table")
+    parser.add_argument("--patient", default=None, help="external_id of a single patient")
+    args = parser.parse_args()
+
+    n = rebuild_latest_results(args.patient)
+    print(f"✅ Rebuilt latest results for {n} patient(s)")
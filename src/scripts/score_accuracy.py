@@ -1,6 +1,7 @@
 import requests
 import json
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
+from src.embedding_cache import get_cached_encoder
 import warnings
 warnings.filterwarnings("ignore") # Suppress torch warnings
 
@@ -103,7 +104,7 @@ def get_agentic_response():
 
 def calculate_score():
     print("🧮 Loading Sentence Transformer Model (all-MiniLM-L6-v2)...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = get_cached_encoder()
 
     # 1. Get Generated Report
     raw_report = get_agentic_response()
@@ -118,11 +119,12 @@ def calculate_score():
     print("running comparison...")
     
     # 2. Embed Documents
-    embeddings1 = model.encode(gold_text, convert_to_tensor=True)
-    embeddings2 = model.encode(generated_text, convert_to_tensor=True)
+    # (cached: the gold text is only ever encoded once)
+    embeddings1 = model.encode(gold_text)
+    embeddings2 = model.encode(generated_text)
 
     # 3. Calculate Cosine Similarity
-    cosine_score = util.pytorch_cos_sim(embeddings1, embeddings2).item()
+    cosine_score = util.cos_sim(embeddings1, embeddings2).item()
     
     
     # 4. Keyword Recall (Robust Synonyms)
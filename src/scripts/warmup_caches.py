@@ -0,0 +1,22 @@
+# src/scripts/warmup_caches.py
+"""
+Pre-populate the embedding / retrieval / Tavily / specialist caches for the
+most common test codes (same routine the API runs at startup).
+
+    python -m src.scripts.warmup_caches
+    python -m src.scripts.warmup_caches --codes HGB,TSH,FERRITIN --no-web
+"""
+import argparse
+
+from src.warmup import run_warmup
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm retrieval caches for common test codes")
+    parser.add_argument("--codes", default="", help="comma-separated test codes (default: WARMUP_CODES or built-in defaults)")
+    parser.add_argument("--no-web", action="store_true", help="skip Tavily pre-fetching")
+    args = parser.parse_args()
+
+    codes = [c.strip().upper() for c in args.codes.split(",") if c.strip()]
+    stats = run_warmup(codes or None, include_web=not args.no_web)
+    print(f"✅ Warm-up done: {stats}")
@@ -1,6 +1,22 @@
 # src/specialist_recommender.py
 
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
+
+# Hematology-related tests
+HEME_CODES = {"HGB", "HCT", "RBC", "MCV", "MCH", "MCHC", "PLT"}
+# Thyroid-related
+THYROID_CODES = {"TSH", "T3", "T4", "FT3", "FT4"}
+# Lipid-related
+LIPID_CODES = {"TC", "LDL", "HDL", "TG", "VLDL", "NONHDL"}
+# Glucose/diabetes-related
+GLUCOSE_CODES = {"FBG", "RBG", "PPBG", "FBS", "RBS", "HBA1C"}
+# Kidney-related
+KIDNEY_CODES = {"CREAT", "UREA", "BUN", "EGFR"}
+# Liver-related
+LIVER_CODES = {"ALT", "AST", "SGPT", "SGOT", "ALP", "GGT", "BILIT"}
+
+SPECIALIST_CODES = HEME_CODES | THYROID_CODES | LIPID_CODES | GLUCOSE_CODES | KIDNEY_CODES | LIVER_CODES
 
 
 def recommend_specialist_for_test_code(code: str) -> List[str]:
@@ -8,54 +24,53 @@ def recommend_specialist_for_test_code(code: str) -> List[str]:
     Very simple, rule-based specialist recommender.
     Input: lab test code (or name-ish code)
     Output: list of specialist roles that typically handle issues with this test.
+    Unknown codes go to the LLM; its answers are cached per code, its failures are not
+    (a transient error falls back to Internal Medicine for this call only).
     """
     code = code.upper().strip()
+    static = _static_specialists(code)
+    if static:
+        return static
+    try:
+        return list(_llm_specialists_cached(code))
+    except Exception as e:
+        print(f"Specialist LLM fallback failed: {e}")
+
+    # Ultimate Default
+    return ["Internal Medicine"]
 
-    # Hematology-related tests
-    heme = {"HGB", "HCT", "RBC", "MCV", "MCH", "MCHC", "PLT"}
-    # Thyroid-related
-    thyroid = {"TSH", "T3", "T4", "FT3", "FT4"}
-    # Lipid-related
-    lipids = {"TC", "LDL", "HDL", "TG", "VLDL", "NONHDL"}
-    # Glucose/diabetes-related
-    glucose = {"FBG", "RBG", "PPBG", "FBS", "RBS", "HBA1C"}
-    # Kidney-related
-    kidney = {"CREAT", "UREA", "BUN", "EGFR"}
-    # Liver-related
-    liver = {"ALT", "AST", "SGPT", "SGOT", "ALP", "GGT", "BILIT"}
-
-    if code in heme:
+
+def _static_specialists(code: str) -> List[str]:
+    if code in HEME_CODES:
         return ["Hematologist", "Internal Medicine"]
-    if code in thyroid:
+    if code in THYROID_CODES:
         return ["Endocrinologist", "Internal Medicine"]
-    if code in lipids:
+    if code in LIPID_CODES:
         return ["Cardiologist", "Internal Medicine"]
-    if code in glucose:
+    if code in GLUCOSE_CODES:
         return ["Endocrinologist", "Diabetologist"]
-    if code in kidney:
+    if code in KIDNEY_CODES:
         return ["Nephrologist", "Internal Medicine"]
-    if code in liver:
+    if code in LIVER_CODES:
         return ["Hepatologist", "Gastroenterologist", "Internal Medicine"]
+    return []
 
-    # LLM Fallback for unknown tests (Hybrid Neuro-Symbolic approach)
-    try:
-        from src.llm import get_llm
-        llm = get_llm()
-        
-        prompt = f"""
-        You are a medical triage assistant.
-        Which medical specialist is most appropriate to consult for an abnormal result in the lab test: "{code}"?
-        Return ONLY a comma-separated list of 1-2 specialist roles (e.g. "Neurologist, Immunologist").
-        """
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        # Basic cleanup: remove quotes, clean spaces
-        specialists = [s.strip() for s in content.replace('"', '').split(',') if s.strip()]
-        
-        if specialists:
-             return specialists
-    except Exception as e:
-        print(f"Specialist LLM fallback failed: {e}")
 
-    # Ultimate Default
-    return ["Internal Medicine"]
+@lru_cache(maxsize=512)
+def _llm_specialists_cached(code: str) -> Tuple[str, ...]:
+    """LLM Fallback for unknown tests (Hybrid Neuro-Symbolic approach). Raises instead of caching a failure."""
+    from src.llm import get_llm
+    llm = get_llm()
+
+    prompt = f"""
+    You are a medical triage assistant.
+    Which medical specialist is most appropriate to consult for an abnormal result in the lab test: "{code}"?
+    Return ONLY a comma-separated list of 1-2 specialist roles (e.g. "Neurologist, Immunologist").
+    """
+    response = llm.invoke(prompt)
+    content = response.content.strip()
+    # Basic cleanup: remove quotes, clean spaces
+    specialists = tuple(s.strip() for s in content.replace('"', '').split(',') if s.strip())
+    if not specialists:
+        raise ValueError(f"empty specialist answer for {code}")
+    return specialists
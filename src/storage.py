@@ -0,0 +1,355 @@
+# src/storage.py
+
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from src.config import DB_BACKEND, SQLITE_PATH
+
+# The persistence modules keep writing portable SQL with %s placeholders and
+# get_connection(); everything that differs between MySQL and SQLite (upserts,
+# INSERT IGNORE, row locks, schema introspection, migration lock, EXPLAIN)
+# goes through the Storage returned by get_storage().
+
+
+class Storage:
+    name = "base"
+
+    def connect(self):
+        raise NotImplementedError
+
+    # --- SQL dialect ---
+
+    def upsert_sql(self, table: str, cols: Sequence[str], conflict_cols: Sequence[str],
+                   update_cols: Sequence[str], extra_updates: Sequence[str] = ()) -> str:
+        """INSERT ... VALUES (%s, ...) that updates `update_cols` when `conflict_cols` already exist."""
+        raise NotImplementedError
+
+    def insert_ignore_sql(self, table: str, cols: Sequence[str], conflict_cols: Sequence[str] = ()) -> str:
+        """INSERT ... VALUES (%s, ...) that silently skips rows hitting a unique key."""
+        raise NotImplementedError
+
+    # Appended to SELECTs that read rows the transaction is about to rewrite
+    for_update = ""
+
+    def upsert_id(self, cur, table: str, cols: Sequence[str], values: Sequence[Any],
+                  conflict_cols: Sequence[str], update_cols: Sequence[str]) -> int:
+        """Upsert one row and return its id, inserted or existing, in one statement."""
+        raise NotImplementedError
+
+    # --- Schema ---
+
+    def index_exists(self, cur, table: str, index: str) -> bool:
+        raise NotImplementedError
+
+    def column_exists(self, cur, table: str, column: str) -> bool:
+        raise NotImplementedError
+
+    @contextmanager
+    def migration_lock(self, cur) -> Iterator[None]:
+        # No cross-process lock by default (SQLite: one node, DDL is IF NOT EXISTS)
+        yield
+
+    def now(self) -> datetime:
+        """App-side timestamp in the same clock as the backend's CURRENT_TIMESTAMP."""
+        return datetime.now().replace(microsecond=0)
+
+    def explain(self, cur, sql: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        """Plan rows normalised to {table, type, key, rows}; type "ALL" = full scan."""
+        raise NotImplementedError
+
+
+def _placeholders(cols: Sequence[str]) -> str:
+    return ", ".join(["%s"] * len(cols))
+
+
+# ---------- MySQL ----------
+
+class MySQLStorage(Storage):
+    name = "mysql"
+    for_update = " FOR UPDATE"
+
+    _LOCK_NAME = "patient_report_intel_migrations"
+
+    def connect(self):
+        from src.db import get_pool
+        return get_pool().get()
+
+    def upsert_sql(self, table, cols, conflict_cols, update_cols, extra_updates=()):
+        updates = list(extra_updates) + [f"{c} = VALUES({c})" for c in update_cols]
+        return (
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({_placeholders(cols)}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+        )
+
+    def insert_ignore_sql(self, table, cols, conflict_cols=()):
+        return f"INSERT IGNORE INTO {table} ({', '.join(cols)}) VALUES ({_placeholders(cols)})"
+
+    def upsert_id(self, cur, table, cols, values, conflict_cols, update_cols):
+        # LAST_INSERT_ID(id) makes lastrowid the existing id on duplicates too, no extra SELECT
+        cur.execute(self.upsert_sql(table, cols, conflict_cols, update_cols, ["id = LAST_INSERT_ID(id)"]), tuple(values))
+        return int(cur.lastrowid)
+
+    def index_exists(self, cur, table, index):
+        cur.execute(
+            """
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+            """,
+            (table, index),
+        )
+        return cur.fetchone() is not None
+
+    def column_exists(self, cur, table, column):
+        cur.execute(
+            """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            LIMIT 1
+            """,
+            (table, column),
+        )
+        return cur.fetchone() is not None
+
+    @contextmanager
+    def migration_lock(self, cur):
+        # A named lock keeps several API workers starting at once from racing
+        cur.execute("SELECT GET_LOCK(%s, 60)", (self._LOCK_NAME,))
+        if cur.fetchone()[0] != 1:
+            raise TimeoutError("Timed out waiting for the schema migration lock")
+        try:
+            yield
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (self._LOCK_NAME,))
+            cur.fetchall()
+
+    def explain(self, cur, sql, params):
+        cur.execute("EXPLAIN " + sql, tuple(params))
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+# ---------- SQLite ----------
+
+# Explicit adapters/converters: DATE / TIMESTAMP columns round-trip as date / datetime
+# like they do through mysql.connector (the sqlite3 defaults are deprecated in 3.12).
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(sep=" "))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over sqlite3: %s placeholders, dictionary rows, `with` support."""
+
+    def __init__(self, cur: sqlite3.Cursor, dictionary: bool = False):
+        self._cur = cur
+        self._dictionary = dictionary
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        self._cur.execute(self._sql(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql: str, rows):
+        self._cur.executemany(self._sql(sql), [tuple(r) for r in rows])
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size: int = 1):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection:
+    """
+    One sqlite3 connection per get_connection() checkout, like a pooled MySQL connection:
+    a nested checkout is a separate connection, so closing it can't roll back the outer
+    transaction. close() rolls back anything uncommitted and closes the handle.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self, dictionary: bool = False) -> SQLiteCursor:
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def get_server_info(self) -> str:
+        return f"sqlite-{sqlite3.sqlite_version}"
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    Embedded single-file database for single-node deployments and benchmarks.
+    WAL mode lets API threads read while one of them writes. Opening a local
+    connection is cheap, so every checkout gets its own (no pool needed).
+    ":memory:" is one shared in-memory database for the lifetime of this object.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._wal_set = False
+        self._memory_keeper: Optional[sqlite3.Connection] = None
+        if path == ":memory:":
+            # a named shared-cache memory DB lives as long as one connection to it does
+            self._uri = f"file:storage_{id(self)}?mode=memory&cache=shared"
+            self._memory_keeper = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+
+    def _open(self) -> sqlite3.Connection:
+        if self._memory_keeper is not None:
+            conn = sqlite3.connect(self._uri, uri=True, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+            if not self._wal_set:
+                conn.execute("PRAGMA journal_mode=WAL")  # persistent: once per database file
+                self._wal_set = True
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def connect(self) -> SQLiteConnection:
+        return SQLiteConnection(self._open())
+
+    def upsert_sql(self, table, cols, conflict_cols, update_cols, extra_updates=()):
+        updates = list(extra_updates) + [f"{c} = excluded.{c}" for c in update_cols]
+        return (
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({_placeholders(cols)}) "
+            f"ON CONFLICT ({', '.join(conflict_cols)}) DO UPDATE SET {', '.join(updates)}"
+        )
+
+    def insert_ignore_sql(self, table, cols, conflict_cols=()):
+        return f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({_placeholders(cols)})"
+
+    def upsert_id(self, cur, table, cols, values, conflict_cols, update_cols):
+        sql = self.upsert_sql(table, cols, conflict_cols, update_cols)
+        if sqlite3.sqlite_version_info >= (3, 35):
+            cur.execute(sql + " RETURNING id", tuple(values))
+            return int(cur.fetchone()[0])
+        cur.execute(sql, tuple(values))
+        where = " AND ".join(f"{c} = %s" for c in conflict_cols)
+        cur.execute(f"SELECT id FROM {table} WHERE {where}", tuple(values[cols.index(c)] for c in conflict_cols))
+        return int(cur.fetchone()[0])
+
+    def index_exists(self, cur, table, index):
+        cur.execute(f"PRAGMA index_list({table})")
+        return any(row[1] == index for row in cur.fetchall())
+
+    def column_exists(self, cur, table, column):
+        cur.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cur.fetchall())
+
+    def now(self):
+        # SQLite's CURRENT_TIMESTAMP is UTC
+        return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+    def explain(self, cur, sql, params):
+        """EXPLAIN QUERY PLAN details ("SCAN tr", "SEARCH r USING INDEX ...") in the MySQL shape."""
+        cur.execute("EXPLAIN QUERY PLAN " + sql, tuple(params))
+        plan = []
+        derived = set()
+        for row in cur.fetchall():
+            detail = str(row[-1])
+            sub = re.match(r"(?:CO-ROUTINE|MATERIALIZE) (\S+)", detail)
+            if sub:
+                derived.add(sub.group(1))
+                continue
+            m = re.match(r"(SCAN|SEARCH) (\S+)(?: USING (?:COVERING |INTEGER PRIMARY KEY|PRIMARY KEY)?(?:INDEX )?(\S+)?)?", detail)
+            if not m:
+                continue
+            scan, table, key = m.group(1), m.group(2), m.group(3)
+            if table in derived:
+                table = f"<{table}>"  # subquery in FROM, like MySQL's <derivedN>
+            uses_key = " USING " in detail
+            plan.append({
+                "table": table,
+                "type": "ALL" if scan == "SCAN" and not uses_key else "ref",
+                "key": (key or "PRIMARY") if uses_key else None,
+                "rows": None,
+                "detail": detail,
+            })
+        return plan
+
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """Process-wide Storage for DB_BACKEND ("mysql" | "sqlite")."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if DB_BACKEND == "sqlite":
+                    _storage = SQLiteStorage(SQLITE_PATH)
+                elif DB_BACKEND == "mysql":
+                    _storage = MySQLStorage()
+                else:
+                    raise ValueError(f"Unknown DB_BACKEND {DB_BACKEND!r} (expected mysql or sqlite)")
+    return _storage
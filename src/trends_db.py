@@ -1,6 +1,7 @@
 # src/trends_db.py
 
 from __future__ import annotations
+import json
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 from src.db import get_connection
@@ -72,43 +73,129 @@ def _to_date(val: str):
     finally:
         conn.close()
 
+# History query: one lookup of the patient by external_id, a backward range scan of
+# reports on uq_reports_patient_date (patient_id, report_date) that stops after N rows,
+# then ref lookups on test_results (report_id, code) which also give the per-report
+# code order. ORDER BY ... LIMIT rather than ROW_NUMBER(): a window function has to
+# number (and materialise) every report of the patient before filtering.
+HISTORY_SQL = """
+    SELECT
+      lr.external_id,
+      lr.report_date,
+      tr.code, tr.name, tr.value, tr.unit,
+      tr.normal_range_low, tr.normal_range_high
+    FROM (
+        SELECT p.external_id, r.id, r.report_date
+        FROM patients_new p
+        JOIN reports r ON r.patient_id = p.id
+        WHERE p.external_id = %s
+        ORDER BY r.report_date DESC
+        LIMIT %s
+    ) AS lr
+    JOIN test_results tr ON tr.report_id = lr.id
+    ORDER BY lr.report_date DESC, tr.code
+"""
+
+
 def fetch_last_results_for_patient(external_id: str, limit_reports: int = 5) -> List[Dict[str, Any]]:
     """
-    Correct: limits by number of reports, not joined rows.
+    Returns rows for the last N reports of a patient (limited by reports, not rows),
+    newest report first, codes in order within a report.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(HISTORY_SQL, (external_id, limit_reports))
+            return cur.fetchall() or []
+    finally:
+        conn.close()
+
+
+def fetch_latest_results(external_id: str) -> List[Dict[str, Any]]:
+    """
+    patient_latest_results rows for a patient (maintained by report_store on write):
+    one unique-key lookup + a primary-key range on (patient_id, code).
     """
     conn = get_connection()
     try:
         with conn.cursor(dictionary=True) as cur:
             cur.execute(
                 """
-                SELECT
-                  p.external_id,
-                  r.report_date,
-                  p.external_id,
-                  r.report_date,
-                  tr.code, tr.name, tr.value, tr.unit,
-                  tr.normal_range_low, tr.normal_range_high
+                SELECT pl.*
                 FROM patients_new p
-                JOIN reports r ON r.patient_id = p.id
-                JOIN test_results tr ON tr.report_id = r.id
-                JOIN (
-                    SELECT r2.id
-                    FROM reports r2
-                    JOIN patients_new p2 ON p2.id = r2.patient_id
-                    WHERE p2.external_id = %s
-                    ORDER BY r2.report_date DESC
-                    LIMIT %s
-                ) AS latest_reports ON r.id = latest_reports.id
+                JOIN patient_latest_results pl ON pl.patient_id = p.id
                 WHERE p.external_id = %s
-                ORDER BY r.report_date DESC, tr.code;
                 """,
-                (external_id, limit_reports, external_id),
+                (external_id,),
             )
             return cur.fetchall() or []
     finally:
         conn.close()
 
 
+def trends_from_latest(rows: List[Dict[str, Any]], current_report_date: str) -> Optional[Dict[str, Any]]:
+    """
+    Same output as compute_trends_from_rows, read from patient_latest_results.
+    Returns None when the table can't answer for this report (nothing stored yet,
+    or a back-dated report older than what's stored) - callers then use the history.
+    """
+    current_dt = _to_date(current_report_date)
+    if not rows or any(r["last_date"] > current_dt for r in rows):
+        return None
+    if not any(r["last_date"] == current_dt for r in rows):
+        return None
+
+    trends: Dict[str, Any] = {}
+    for r in rows:
+        if r["last_date"] != current_dt:
+            continue  # not in the current report
+        code = (r.get("code") or "").upper()
+        if r.get("prev_date") is None:
+            trends[code] = None
+            continue
+
+        last_val = float(r["last_value"]) if r["last_value"] is not None else None
+        prev_val = float(r["prev_value"]) if r["prev_value"] is not None else None
+
+        direction = "stable"
+        if last_val is not None and prev_val is not None:
+            if last_val > prev_val:
+                direction = "up"
+            elif last_val < prev_val:
+                direction = "down"
+
+        trends[code] = {
+            "code": code,
+            "name": r.get("name") or code,
+            "prev_value": prev_val,
+            "prev_unit": r.get("prev_unit"),
+            "prev_date": str(r["prev_date"]),
+            "last_value": last_val,
+            "last_unit": r.get("last_unit"),
+            "last_date": str(r["last_date"]),
+            "direction": direction,
+            "normal_range_low": r.get("normal_range_low"),
+            "normal_range_high": r.get("normal_range_high"),
+        }
+    return trends
+
+
+def series_from_latest(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """series_by_code from the rolling window stored with each latest row (oldest -> newest)."""
+    series: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        recent = r.get("recent_json")
+        if isinstance(recent, (bytes, bytearray)):
+            recent = recent.decode("utf-8")
+        if isinstance(recent, str):
+            recent = json.loads(recent)
+        series[(r.get("code") or "").upper()] = [
+            {**p, "value": float(p["value"]) if p.get("value") is not None else None}
+            for p in (recent or [])
+        ]
+    return series
+
+
 def compute_trends_from_rows(rows: List[Dict[str, Any]], current_report_date: str) -> Dict[str, Any]:
     """
     Compute trend for each code using current and most recent previous value.
@@ -172,16 +259,13 @@ def compute_trends_from_rows(rows: List[Dict[str, Any]], current_report_date: st
 
 from collections import defaultdict
 
-def fetch_series_for_patient(external_id: str, lookback_reports: int = 5):
+def build_series_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """
-    Returns:
-      series_by_code = {
-        "HGB": [{"date": "2025-10-01", "value": 11.2, "unit":"g/dL"}, ...],
-        ...
-      }
+    series_by_code = {
+      "HGB": [{"date": "2025-10-01", "value": 11.2, "unit":"g/dL"}, ...],
+      ...
+    }
     """
-    rows = fetch_last_results_for_patient(external_id, limit_reports=lookback_reports)
-
     by_code = defaultdict(list)
 
     # rows are sorted by report_date DESC; reverse to plot oldest -> newest
@@ -200,6 +284,36 @@ def fetch_series_for_patient(external_id: str, lookback_reports: int = 5):
 
     return dict(by_code)
 
+
+def fetch_series_for_patient(external_id: str, lookback_reports: int = 5):
+    """
+    Returns series_by_code (see build_series_from_rows) straight from the DB.
+    Inside the graph prefer the per-request history (fetch_patient_history).
+    """
+    rows = fetch_last_results_for_patient(external_id, limit_reports=lookback_reports)
+    return build_series_from_rows(rows)
+
+
+def fetch_patient_history(external_id: str, limit_reports: int = 5) -> Dict[str, Any]:
+    """
+    Per-request history: the last `limit_reports` reports' rows, fetched once and
+    kept in ReportState["history"] so trends, series and analysis share one query.
+    """
+    return {
+        "external_id": external_id,
+        "limit_reports": limit_reports,
+        "rows": fetch_last_results_for_patient(external_id, limit_reports=limit_reports),
+    }
+
+
+def history_for_state(state: Dict[str, Any], limit_reports: int = 5) -> Dict[str, Any]:
+    """ReportState["history"] if it's for this patient and deep enough, else one fresh fetch."""
+    external_id = state["patient"]["external_id"]
+    history = state.get("history")
+    if history and history.get("external_id") == external_id and history.get("limit_reports", 0) >= limit_reports:
+        return history
+    return fetch_patient_history(external_id, limit_reports=limit_reports)
+
 from typing import Tuple
 
 def _clean_series(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
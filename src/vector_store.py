@@ -0,0 +1,256 @@
+# src/vector_store.py
+
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.config import (
+    VECTOR_STORE,
+    VECTOR_STORE_DIR,
+    FAISS_IVF_MIN_VECTORS,
+    FAISS_NLIST,
+    FAISS_NPROBE,
+    FAISS_TRAIN_SAMPLE,
+)
+
+# (id, document, metadata), best match first
+Hit = Tuple[str, str, Dict[str, Any]]
+
+VECTORS_FILE = "vectors.npy"
+FAISS_FILE = "index.faiss"
+# One id/doc list per backend: each is row-aligned to its own vectors.npy / index.faiss,
+# so rebuilding one export must never touch the other's
+DOCS_FILES = {"numpy": "numpy_docs.json", "faiss": "faiss_docs.json"}
+
+
+class VectorStore:
+    """
+    Minimal interface behind local_medical_knowledge_with_sources.
+    Chroma stays the source of truth (ingest writes there); the numpy/faiss
+    stores are read-only exports of it, rebuilt by the ingest scripts.
+    """
+
+    name = "base"
+
+    def query(self, embedding: List[float], k: int) -> List[Hit]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, collection: Any):
+        self.col = collection
+
+    def query(self, embedding: List[float], k: int) -> List[Hit]:
+        res = self.col.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            include=["documents", "metadatas"],
+        )
+        return [
+            (doc_id, doc or "", meta or {})
+            for doc_id, doc, meta in zip(
+                res.get("ids", [[]])[0],
+                res.get("documents", [[]])[0],
+                res.get("metadatas", [[]])[0],
+            )
+        ]
+
+    def count(self) -> int:
+        return self.col.count()
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.clip(norms, 1e-12, None)
+
+
+def _load_docs(store_dir: str, backend: str, n_vectors: int) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    with open(os.path.join(store_dir, DOCS_FILES[backend]), "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    if len(payload["ids"]) != n_vectors:
+        raise ValueError(
+            f"{backend} export in {store_dir} is inconsistent: {n_vectors} vectors but "
+            f"{len(payload['ids'])} docs (interrupted rebuild?)"
+        )
+    return payload["ids"], payload["docs"], payload["metas"]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact search as one matrix-vector product over a memory-mapped float32
+    matrix of L2-normalised vectors. No index structures: best for small corpora.
+    """
+
+    name = "numpy"
+
+    def __init__(self, store_dir: str = VECTOR_STORE_DIR):
+        self.vectors = np.load(os.path.join(store_dir, VECTORS_FILE), mmap_mode="r")
+        self.ids, self.docs, self.metas = _load_docs(store_dir, self.name, self.vectors.shape[0])
+
+    def query(self, embedding: List[float], k: int) -> List[Hit]:
+        if len(self.ids) == 0:
+            return []
+        q = _normalize(np.asarray(embedding, dtype=np.float32))
+        scores = self.vectors @ q
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], self.docs[i], self.metas[i]) for i in top]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+
+class FaissVectorStore(VectorStore):
+    """
+    FAISS inner-product index (vectors are normalised, so IP == cosine).
+    Below FAISS_IVF_MIN_VECTORS it is a flat (exact, brute-force) index like the
+    numpy store; above, an IVF index that only scans FAISS_NPROBE clusters per
+    query, with its inverted lists memory-mapped rather than read into RAM.
+    """
+
+    name = "faiss"
+
+    def __init__(self, store_dir: str = VECTOR_STORE_DIR, nprobe: int = FAISS_NPROBE):
+        import faiss
+
+        self.index = faiss.read_index(os.path.join(store_dir, FAISS_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        if hasattr(self.index, "nprobe"):  # IVF
+            self.index.nprobe = max(1, nprobe)
+        self.ids, self.docs, self.metas = _load_docs(store_dir, self.name, self.index.ntotal)
+
+    def query(self, embedding: List[float], k: int) -> List[Hit]:
+        q = _normalize(np.asarray([embedding], dtype=np.float32))
+        _, idx = self.index.search(q, min(k, len(self.ids)))
+        return [(self.ids[i], self.docs[i], self.metas[i]) for i in idx[0] if i >= 0]
+
+    def count(self) -> int:
+        return self.index.ntotal
+
+
+# ---------- building (called from the ingest scripts) ----------
+
+def _iter_chroma_pages(col: Any, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    offset = 0
+    while True:
+        page = col.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        if not page.get("ids"):
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _faiss_index(col: Any, total: int, dim: int):
+    """
+    Empty index for `total` vectors: flat below FAISS_IVF_MIN_VECTORS, otherwise an
+    IndexIVFFlat whose quantizer is trained on an evenly spaced sample of the collection.
+    """
+    import faiss
+
+    if total < max(FAISS_IVF_MIN_VECTORS, 39):
+        return faiss.IndexFlatIP(dim)
+    nlist = FAISS_NLIST or int(4 * np.sqrt(total))
+    nlist = max(1, min(nlist, total // 39))  # faiss wants >= 39 training points per cluster
+    step = max(1, total // max(FAISS_TRAIN_SAMPLE, nlist * 39))
+    sample = np.concatenate([
+        _normalize(np.asarray(page["embeddings"], dtype=np.float32))[::step]
+        for page in _iter_chroma_pages(col)
+    ])
+    index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(sample)
+    return index
+
+
+def build_vector_store(col: Any, backend: str = VECTOR_STORE, store_dir: str = VECTOR_STORE_DIR) -> int:
+    """
+    Exports the Chroma collection into a numpy or faiss store under `store_dir`,
+    page by page. Returns the number of vectors written (0 for chroma: nothing to build).
+    """
+    if backend == "chroma":
+        return 0
+    if backend not in ("numpy", "faiss"):
+        raise ValueError(f"Unknown VECTOR_STORE {backend!r} (expected chroma, numpy or faiss)")
+
+    os.makedirs(store_dir, exist_ok=True)
+    total = col.count()
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[Dict[str, Any]] = []
+    matrix = None
+    faiss_index = None
+
+    for page in _iter_chroma_pages(col):
+        vecs = _normalize(np.asarray(page["embeddings"], dtype=np.float32))
+        if backend == "numpy":
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    os.path.join(store_dir, VECTORS_FILE + ".tmp"),
+                    mode="w+", dtype=np.float32, shape=(total, vecs.shape[1]),
+                )
+            matrix[len(ids):len(ids) + len(vecs)] = vecs
+        else:
+            if faiss_index is None:
+                faiss_index = _faiss_index(col, total, vecs.shape[1])
+            faiss_index.add(vecs)
+
+        ids.extend(page["ids"])
+        docs.extend(d or "" for d in page["documents"])
+        metas.extend(m or {} for m in page["metadatas"])
+
+    if backend == "numpy":
+        if matrix is None:
+            np.save(os.path.join(store_dir, VECTORS_FILE), np.zeros((0, 1), dtype=np.float32))
+        else:
+            matrix.flush()
+            del matrix
+            os.replace(os.path.join(store_dir, VECTORS_FILE + ".tmp"), os.path.join(store_dir, VECTORS_FILE))
+    else:
+        import faiss
+        if faiss_index is None:
+            faiss_index = faiss.IndexFlatIP(1)
+        tmp_path = os.path.join(store_dir, FAISS_FILE + ".tmp")
+        faiss.write_index(faiss_index, tmp_path)
+        os.replace(tmp_path, os.path.join(store_dir, FAISS_FILE))
+
+    docs_path = os.path.join(store_dir, DOCS_FILES[backend])
+    with open(docs_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "docs": docs, "metas": metas}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(docs_path + ".tmp", docs_path)
+
+    return len(ids)
+
+
+def vector_store_exists(backend: str = VECTOR_STORE, store_dir: str = VECTOR_STORE_DIR) -> bool:
+    if backend == "chroma":
+        return True
+    data_file = VECTORS_FILE if backend == "numpy" else FAISS_FILE
+    return os.path.exists(os.path.join(store_dir, data_file)) and os.path.exists(os.path.join(store_dir, DOCS_FILES[backend]))
+
+
+def get_vector_store(col: Any, backend: str = VECTOR_STORE, store_dir: str = VECTOR_STORE_DIR) -> VectorStore:
+    """
+    Store selected by VECTOR_STORE. If a numpy/faiss export hasn't been built
+    yet, falls back to Chroma (with a warning) rather than failing retrieval.
+    """
+    if backend == "chroma":
+        return ChromaVectorStore(col)
+    if not vector_store_exists(backend, store_dir):
+        print(f"VECTOR_STORE={backend} but no export in {store_dir}; using chroma. Run the ingest script.")
+        return ChromaVectorStore(col)
+    try:
+        if backend == "numpy":
+            return NumpyVectorStore(store_dir)
+        if backend == "faiss":
+            return FaissVectorStore(store_dir)
+    except ValueError as e:
+        print(f"{e}; using chroma. Re-run the ingest script.")
+        return ChromaVectorStore(col)
+    raise ValueError(f"Unknown VECTOR_STORE {backend!r} (expected chroma, numpy or faiss)")
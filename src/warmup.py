@@ -0,0 +1,133 @@
+# src/warmup.py
+
+from __future__ import annotations
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config import WARMUP_CODES, WARMUP_WEB, WARMUP_LLM, WARMUP_AUDIT_LIMIT, TAVILY_API_KEY, SEARCH_BACKEND
+from src.knowledge_bundles import DIRECTIONS, query_name, local_query, web_query
+
+# "cold" -> "warming" -> "ready" | "failed"; read by /health
+_status: Dict[str, Any] = {"state": "cold", "codes": 0, "seconds": None, "error": None}
+_lock = threading.Lock()
+
+
+def recent_audit_codes(limit: int = WARMUP_AUDIT_LIMIT) -> List[str]:
+    """Test codes seen in the last `limit` audit_logs rows (most frequent first). [] if the DB is down."""
+    try:
+        from src.db import get_connection
+        conn = get_connection()
+    except Exception as e:
+        print(f"warm-up: audit_logs unavailable ({e})")
+        return []
+
+    counts: Dict[str, int] = {}
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT escalation_json FROM audit_logs ORDER BY id DESC LIMIT %s", (limit,))
+        for (payload,) in cur.fetchall():
+            try:
+                rows = json.loads(payload) if isinstance(payload, (str, bytes)) else (payload or [])
+            except ValueError:
+                continue
+            for r in rows:
+                code = str(r.get("code") or "").upper().strip()
+                if code:
+                    counts[code] = counts.get(code, 0) + 1
+        cur.close()
+    except Exception as e:
+        print(f"warm-up: could not read audit_logs ({e})")
+    finally:
+        conn.close()
+    return sorted(counts, key=lambda c: -counts[c])
+
+
+def default_warmup_codes() -> List[str]:
+    """SEX_RANGES codes + specialist code sets + codes from recent audit logs (de-duplicated)."""
+    from src.normalization.unit_ranges import SEX_RANGES
+    from src.specialist_recommender import SPECIALIST_CODES
+
+    codes = list(SEX_RANGES) + sorted(SPECIALIST_CODES) + recent_audit_codes()
+    return list(dict.fromkeys(c.upper() for c in codes))
+
+
+def run_warmup(codes: Optional[List[str]] = None, include_web: bool = WARMUP_WEB) -> Dict[str, Any]:
+    """
+    Pre-populates, for each code and direction, exactly what escalation_and_knowledge_node
+    will ask for: embedding model + cache, local retrieval cache, Tavily cache and (with
+    WARMUP_LLM) the LLM specialist lookup for codes outside the static table.
+    Errors on one code don't stop the rest.
+    """
+    codes = codes or WARMUP_CODES or default_warmup_codes()
+    include_web = include_web and (bool(TAVILY_API_KEY) or SEARCH_BACKEND == "replay")
+    started = time.monotonic()
+
+    # Importing loads the embedding model, Chroma collection, BM25 index and bundles
+    from src.local_knowledge_tool import cached_local_medical_knowledge_with_sources
+    from src.specialist_recommender import SPECIALIST_CODES, recommend_specialist_for_test_code
+    from src.embedding_cache import get_cached_encoder
+    web_search = None
+    if include_web:
+        from src.knowledge_tool import cached_web_medical_knowledge_with_sources as web_search
+
+    stats = {"codes": len(codes), "local": 0, "web": 0, "errors": 0}
+    for code in codes:
+        name = query_name(code)
+        if WARMUP_LLM and code not in SPECIALIST_CODES:  # static-table codes need no warming
+            try:
+                recommend_specialist_for_test_code(code)
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"warm-up: specialist lookup failed for {code}: {e}")
+
+        for direction in DIRECTIONS:
+            try:
+                cached_local_medical_knowledge_with_sources(local_query(name, direction), k=2)
+                stats["local"] += 1
+                if web_search is not None:
+                    # Urgent variant only differs by suffix; warm the common one
+                    web_search(web_query(name, direction), max_results=3)
+                    stats["web"] += 1
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"warm-up: retrieval failed for {code}/{direction}: {e}")
+
+    encoder = get_cached_encoder()
+    if encoder.cache is not None:
+        encoder.cache.flush()  # persist the new embeddings now, not only at exit
+    stats["seconds"] = round(time.monotonic() - started, 2)
+    return stats
+
+
+def _run_in_background(codes: Optional[List[str]], include_web: bool) -> None:
+    try:
+        stats = run_warmup(codes, include_web=include_web)
+        with _lock:
+            _status.update(state="ready", codes=stats["codes"], seconds=stats["seconds"])
+        print(f"✅ Warm-up done: {stats}")
+    except Exception as e:
+        with _lock:
+            _status.update(state="failed", error=str(e))
+        print(f"warm-up failed: {e}")
+
+
+def start_background_warmup(codes: Optional[List[str]] = None, include_web: bool = WARMUP_WEB) -> None:
+    """Runs the warm-up once in a daemon thread; /health reports 'warming' until it finishes."""
+    with _lock:
+        if _status["state"] != "cold":
+            return
+        _status["state"] = "warming"
+    threading.Thread(target=_run_in_background, args=(codes, include_web), daemon=True, name="warmup").start()
+
+
+def mark_ready() -> None:
+    """For processes that skip warm-up (WARMUP_ON_STARTUP=false)."""
+    with _lock:
+        _status["state"] = "ready"
+
+
+def warmup_status() -> Dict[str, Any]:
+    with _lock:
+        return dict(_status)
@@ -0,0 +1,94 @@
+# SQLite round trip through the same helpers the graph uses (no MySQL needed).
+
+import pytest
+
+import src.storage as storage
+from src.db import get_connection
+from src.graph.report_store import persist_reports
+from src.migrations import LATEST_VERSION, migrate
+from src.trends_db import fetch_last_results_for_patient, fetch_latest_results, trends_from_latest
+
+
+def _report(report_date, hgb, tsh=None):
+    tests = [{"code": "HGB", "name": "Hemoglobin", "value": hgb, "unit": "g/dL",
+              "normal_range_low": 12.0, "normal_range_high": 16.0, "flag": "low" if hgb < 12 else "normal"}]
+    if tsh is not None:
+        tests.append({"code": "TSH", "name": "TSH", "value": tsh, "unit": "mIU/L",
+                      "normal_range_low": 0.4, "normal_range_high": 4.0, "flag": "normal"})
+    return {
+        "patient": {"external_id": "P001", "name": "Test Patient", "sex": "F", "dob": "1980-01-01"},
+        "report_date": report_date,
+        "tests": tests,
+    }
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path, monkeypatch):
+    st = storage.SQLiteStorage(str(tmp_path / "test.db"))
+    monkeypatch.setattr(storage, "_storage", st)
+    assert migrate(verbose=False)[-1] == LATEST_VERSION
+    return st
+
+
+def test_persist_and_read_back(sqlite_storage):
+    results = persist_reports([_report("2024-01-10", 11.0, 2.0), _report("2024-03-10", 12.5)])
+    assert [r["status"] for r in results] == ["inserted", "inserted"]
+    assert results[0]["patient_id"] == results[1]["patient_id"]
+
+    # unchanged content hash -> nothing rewritten
+    again = persist_reports([_report("2024-03-10", 12.5)])
+    assert again[0]["status"] == "unchanged"
+
+    history = fetch_last_results_for_patient("P001", limit_reports=5)
+    assert [(str(r["report_date"]), r["code"]) for r in history] == [
+        ("2024-03-10", "HGB"), ("2024-01-10", "HGB"), ("2024-01-10", "TSH"),
+    ]
+    assert len(fetch_last_results_for_patient("P001", limit_reports=1)) == 1
+
+    latest = {r["code"]: r for r in fetch_latest_results("P001")}
+    assert set(latest) == {"HGB", "TSH"}
+    assert latest["HGB"]["last_value"] == 12.5
+    assert latest["HGB"]["prev_value"] == 11.0
+
+    trends = trends_from_latest(list(latest.values()), "2024-03-10")
+    assert trends is not None and "HGB" in trends
+
+
+def test_upsert_id_returns_existing_id_on_duplicate(sqlite_storage):
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            args = ("patients_new", ("external_id", "name", "sex", "dob"))
+            first = sqlite_storage.upsert_id(cur, *args, ("P9", "A", "M", "1990-01-01"), ("external_id",), ("name", "sex", "dob"))
+            second = sqlite_storage.upsert_id(cur, *args, ("P9", "B", "M", "1990-01-01"), ("external_id",), ("name", "sex", "dob"))
+            cur.execute("SELECT COUNT(*), MAX(name) FROM patients_new WHERE external_id = %s", ("P9",))
+            count, name = cur.fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    assert first == second
+    assert (count, name) == (1, "B")
+
+
+def test_nested_checkout_close_keeps_outer_transaction(sqlite_storage):
+    outer = get_connection()
+    try:
+        with outer.cursor() as cur:
+            cur.execute("INSERT INTO patients_new (external_id, name, sex, dob) VALUES (%s, %s, %s, %s)",
+                        ("P7", "Outer", "F", "1970-01-01"))
+            inner = get_connection()
+            with inner.cursor() as icur:
+                icur.execute("SELECT COUNT(*) FROM patients_new")
+                icur.fetchone()
+            inner.close()
+        outer.commit()
+    finally:
+        outer.close()
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name FROM patients_new WHERE external_id = %s", ("P7",))
+            assert cur.fetchone()[0] == "Outer"
+    finally:
+        conn.close()